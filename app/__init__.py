@@ -38,6 +38,26 @@ def create_app(config_name='default'):
     # 初始化扩展
     db.init_app(app)
     
+    # 文章浏览数写缓冲（后台定期批量写入）
+    from .view_counter import view_buffer
+    view_buffer.init_app(app)
+    
+    # 点赞分片定期合并
+    from .likes import fold_task
+    fold_task.init_app(app)
+    
+    # 访客日志后台批量写入
+    from .visit_logger import visit_logger
+    visit_logger.init_app(app)
+    
+    # 访问统计定期汇总
+    from .visit_stats import rollup_task
+    rollup_task.init_app(app)
+    
+    # IP归属地缓存和评论归属地后台回填
+    from .geo import geo_locator
+    geo_locator.init_app(app)
+    
     # 初始化性能优化扩展
     if compress:
         compress.init_app(app)
@@ -84,12 +104,11 @@ def create_app(config_name='default'):
         if (request.method == 'GET' and 
             request.endpoint and 
             not request.endpoint.startswith(('static', 'admin')) and
+            request.endpoint != 'frontend.search_suggest' and  # 搜索建议随输入频繁请求，不计入访问
             app.config.get('STATS_ENABLE_VISITOR_LOG', True)):
             
             try:
-                from .models import SiteVisit
                 from flask import session
-                from datetime import timedelta
                 from .utils import get_local_now
                 
                 ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
@@ -101,30 +120,19 @@ def create_app(config_name='default'):
                     session['visitor_session'] = str(uuid.uuid4())
                     session.permanent = True
                 
-                session_id = session['visitor_session']
-                page_url = request.url[:255]
-                
-                # 检查重复访问（5分钟内不重复记录）
-                timeout_minutes = app.config.get('STATS_SESSION_TIMEOUT', 5)
-                recent_visit = SiteVisit.query.filter(
-                    SiteVisit.session_id == session_id,
-                    SiteVisit.page_url == page_url,
-                    SiteVisit.visit_time >= get_local_now() - timedelta(minutes=timeout_minutes)
-                ).first()
-                
-                if not recent_visit:
-                    visit = SiteVisit(
-                        ip_address=ip_address,
-                        session_id=session_id,
-                        user_agent=request.headers.get('User-Agent', '')[:500],
-                        referer=request.headers.get('Referer', '')[:255],
-                        page_url=page_url
-                    )
-                    db.session.add(visit)
-                    db.session.commit()
+                # 放入写入队列，由后台线程批量插入（超时时间内的重复访问在内存中去重）
+                visit_logger.record(
+                    visit_time=get_local_now(),
+                    ip_address=ip_address,
+                    session_id=session['visitor_session'],
+                    user_agent=request.headers.get('User-Agent', '')[:500],
+                    referer=request.headers.get('Referer', '')[:255],
+                    page_url=request.url[:255]
+                )
+                rollup_task.ensure_started()
                     
             except Exception:
-                db.session.rollback()
+                app.logger.exception('记录访客日志失败')
     
     # 注册蓝图
     from .frontend import frontend as frontend_bp
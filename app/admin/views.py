@@ -16,6 +16,15 @@ from ..auth import (
 from ..models import Article, Tag, Config, Music
 from .. import db
 from ..utils import get_local_now
+from ..renderer import refresh_article_render, refresh_article_preview
+from ..counters import published_views_of, adjust_published_views
+from ..likes import get_likes_count, reset_like_shards
+from ..view_counter import view_buffer
+from ..search import index_article, remove_article_index
+from ..cache import (
+    bump_versions, comments_version_name,
+    VERSION_ARTICLES, VERSION_TAGS, VERSION_COMMENTS, VERSION_MUSIC
+)
 
 
 def _parse_datetime_string(datetime_str):
@@ -153,6 +162,7 @@ def upload_music():
         )
         
         db.session.add(music)
+        bump_versions(VERSION_MUSIC)
         db.session.commit()
         
         # 返回成功响应
@@ -318,7 +328,14 @@ def new_article():
                 selected_tags = Tag.query.filter(Tag.id.in_(selected_tag_ids)).all()
                 article.tags = selected_tags
             
+            # 保存时预先渲染文章内容和列表预览，前端直接读取缓存
+            refresh_article_render(article)
+            refresh_article_preview(article)
+            
             db.session.add(article)
+            index_article(article)
+            adjust_published_views(published_views_of(article))
+            bump_versions(VERSION_ARTICLES)
             db.session.commit()
             
             status_text = '已发布' if article.status == 'published' else '草稿'
@@ -368,6 +385,10 @@ def edit_article(article_id):
         
         # 处理表单提交
         try:
+            # 记录修改前计入总浏览量的部分，保存时按差值更新计数器
+            old_published_views = published_views_of(article)
+            old_view_count = article.view_count or 0
+            
             article.title = form.title.data.strip()
             article.content = form.content.data
             article.summary = form.summary.data.strip() if form.summary.data else None
@@ -378,8 +399,16 @@ def edit_article(article_id):
             article.is_top = form.is_top.data
             article.allow_comments = form.allow_comments.data
             article.publish_location = form.publish_location.data.strip() if form.publish_location.data else None
-            article.view_count = form.view_count.data or 0
-            article.likes_count = form.likes_count.data or 0
+            views_delta = (form.view_count.data or 0) - old_view_count
+            if views_delta:
+                # 管理员修改了浏览数：丢弃本进程缓冲区中尚未写入的浏览数，并按差值原子更新，
+                # 读取之后其他进程写入的浏览数不会被覆盖，计数器也按同一差值调整
+                view_buffer.discard(article.id)
+                article.view_count = Article.view_count + views_delta
+            if (form.likes_count.data or 0) != get_likes_count(article.id, refresh=True):
+                # 管理员修改了点赞数：以填写的值为准，清空尚未合并的分片
+                reset_like_shards(article.id)
+                article.likes_count = form.likes_count.data or 0
               # 处理时间字段，转换为数据库存储格式
             from datetime import datetime
             
@@ -415,6 +444,15 @@ def edit_article(article_id):
                 # 如果没有选择标签，清除所有标签关联
                 article.tags = []
             
+            # 保存时重新渲染文章内容和列表预览，前端直接读取缓存
+            refresh_article_render(article)
+            refresh_article_preview(article)
+            index_article(article)
+            
+            # view_count 可能是待执行的SQL表达式，按读取的值加差值计算
+            new_published_views = old_view_count + views_delta if article.status == 'published' else 0
+            adjust_published_views(new_published_views - old_published_views)
+            bump_versions(VERSION_ARTICLES)
             db.session.commit()
             
             status_text = '已发布' if article.status == 'published' else '草稿'
@@ -440,7 +478,7 @@ def edit_article(article_id):
         form.allow_comments.data = article.allow_comments
         form.publish_location.data = article.publish_location
         form.view_count.data = article.view_count
-        form.likes_count.data = article.likes_count
+        form.likes_count.data = get_likes_count(article.id)
         # 格式化时间为本地时间字符串
         if article.created_at:
             form.created_at.data = article.created_at.strftime('%Y-%m-%d %H:%M:%S')
@@ -469,8 +507,11 @@ def delete_article(article_id):
         article = Article.query.get_or_404(article_id)
         title = article.title
         
-        # 删除文章
+        # 删除文章及其搜索索引
+        remove_article_index(article.id)
         db.session.delete(article)
+        adjust_published_views(-published_views_of(article))
+        bump_versions(VERSION_ARTICLES)
         db.session.commit()
         
         return jsonify({
@@ -510,10 +551,13 @@ def batch_delete_articles():
         deleted_count = len(articles)
         titles = [article.title for article in articles[:3]]  # 最多显示3个标题
         
-        # 删除文章
+        # 删除文章及其搜索索引
         for article in articles:
+            remove_article_index(article.id)
             db.session.delete(article)
         
+        adjust_published_views(-sum(published_views_of(article) for article in articles))
+        bump_versions(VERSION_ARTICLES)
         db.session.commit()
         
         # 构建成功消息
@@ -544,6 +588,7 @@ def toggle_article_status(article_id):
         article = Article.query.get_or_404(article_id)
         
         # 切换状态
+        old_published_views = published_views_of(article)
         if article.status == 'published':
             article.status = 'draft'
             new_status_text = '草稿'
@@ -552,6 +597,8 @@ def toggle_article_status(article_id):
             new_status_text = '已发布'
         
         article.updated_at = get_local_now()
+        adjust_published_views(published_views_of(article) - old_published_views)
+        bump_versions(VERSION_ARTICLES)
         db.session.commit()
         
         return jsonify({
@@ -602,12 +649,17 @@ def batch_change_status():
         updated_count = 0
         
         # 修改文章状态
+        views_delta = 0
         for article in articles:
             if article.status != target_status:
+                views_delta -= published_views_of(article)
                 article.status = target_status
                 article.updated_at = get_local_now()
+                views_delta += published_views_of(article)
                 updated_count += 1
         
+        adjust_published_views(views_delta)
+        bump_versions(VERSION_ARTICLES)
         db.session.commit()
         
         return jsonify({
@@ -647,53 +699,53 @@ def session_info():
 def statistics():
     """网站访问统计页面"""
     from ..models import SiteVisit, Article
-    from sqlalchemy import func, distinct
-    from datetime import datetime, timedelta
+    from ..counters import get_counter, COUNTER_PUBLISHED_VIEWS
+    from ..visit_stats import (
+        get_visit_summary, get_daily_stats, get_hourly_stats, get_popular_pages, get_top_referers
+    )
+    from datetime import timedelta
     
     # 获取访问统计
     site_stats = SiteVisit.get_stats()
     
+    # 访客日志写入队列状态（当前进程）
+    from ..visit_logger import visit_logger
+    visit_log_stats = visit_logger.get_stats()
+    
+    # IP归属地查询计数（当前进程）
+    from ..geo import geo_locator
+    geo_stats = geo_locator.get_stats()
+    
     # 获取文章统计
     total_articles = Article.query.filter_by(status='published').count()
     total_drafts = Article.query.filter_by(status='draft').count()
-    total_views = db.session.query(func.sum(Article.view_count)).filter_by(status='published').scalar() or 0
+    total_views = get_counter(COUNTER_PUBLISHED_VIEWS)
     
     # 获取最近访问记录（最近50条）
     recent_visits = SiteVisit.query.order_by(SiteVisit.visit_time.desc()).limit(50).all()
     
-    # 获取热门页面统计
-    from sqlalchemy import text
-    popular_pages = db.session.execute(text("""
-        SELECT page_url, COUNT(*) as visit_count, COUNT(DISTINCT ip_address) as unique_visitors
-        FROM site_visits 
-        WHERE visit_time >= :week_ago
-        GROUP BY page_url 
-        ORDER BY visit_count DESC 
-        LIMIT 10
-    """), {'week_ago': datetime.now() - timedelta(days=7)}).fetchall()
+    # 统计日期范围（默认最近7天，最长92天），以下数据均读取汇总表
+    today = get_local_now().date()
+    try:
+        end_day = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        end_day = today
+    try:
+        start_day = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start_day = end_day - timedelta(days=6)
+    if start_day > end_day:
+        start_day, end_day = end_day, start_day
+    start_day = max(start_day, end_day - timedelta(days=91))
     
-    # 获取每日访问统计（最近7天）
-    daily_stats = []
-    for i in range(6, -1, -1):
-        date = datetime.now() - timedelta(days=i)
-        start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end = start + timedelta(days=1)
-        
-        daily_visits = SiteVisit.query.filter(
-            SiteVisit.visit_time >= start,
-            SiteVisit.visit_time < end
-        ).count()
-        
-        daily_unique = db.session.query(func.count(distinct(SiteVisit.ip_address))).filter(
-            SiteVisit.visit_time >= start,
-            SiteVisit.visit_time < end
-        ).scalar() or 0
-        
-        daily_stats.append({
-            'date': start.strftime('%m-%d'),
-            'visits': daily_visits,
-            'unique': daily_unique
-        })
+    # 获取热门页面和主要来源统计
+    popular_pages = get_popular_pages(start_day, end_day)
+    top_referers = get_top_referers(start_day, end_day)
+    
+    # 获取每日访问统计和结束日期的分时统计
+    daily_stats = get_daily_stats(start_day, end_day)
+    hourly_stats = get_hourly_stats(end_day)
+    range_summary = get_visit_summary(start_day, end_day)
     
     current_admin = get_current_admin()
     session_info = get_session_info()
@@ -706,6 +758,13 @@ def statistics():
                          recent_visits=recent_visits,
                          popular_pages=popular_pages,
                          daily_stats=daily_stats,
+                         hourly_stats=hourly_stats,
+                         top_referers=top_referers,
+                         range_summary=range_summary,
+                         start_day=start_day,
+                         end_day=end_day,
+                         visit_log_stats=visit_log_stats,
+                         geo_stats=geo_stats,
                          current_admin=current_admin,
                          session_info=session_info)
 
@@ -771,6 +830,7 @@ def create_tag():
         # 创建新标签
         tag = Tag(name=name, color=color)
         db.session.add(tag)
+        bump_versions(VERSION_TAGS)
         db.session.commit()
         
         return jsonify({
@@ -805,6 +865,7 @@ def edit_tag(tag_id):
         # 更新标签
         tag.name = name
         tag.color = color
+        bump_versions(VERSION_TAGS)
         db.session.commit()
         
         return jsonify({
@@ -834,6 +895,7 @@ def delete_tag(tag_id):
         
         tag_name = tag.name
         db.session.delete(tag)
+        bump_versions(VERSION_TAGS)
         db.session.commit()
         
         return jsonify({
@@ -860,8 +922,10 @@ def welcome_edit():
                 return redirect(url_for('admin.welcome_edit'))
             
             # 保存欢迎语标题和副标题
-            Config.set_value('homepage_welcome_title', welcome_title)
-            Config.set_value('homepage_welcome_subtitle', welcome_subtitle)
+            Config.set_many({
+                'homepage_welcome_title': welcome_title,
+                'homepage_welcome_subtitle': welcome_subtitle
+            })
             
             flash('欢迎语更新成功！', 'success')
             return redirect(url_for('admin.welcome_edit'))
@@ -1037,14 +1101,14 @@ def background_edit():
             # 处理预设背景选择
             preset_bg = request.form.get('preset_background')
             if preset_bg and preset_bg in PRESET_BACKGROUNDS:
-                # 使用预设背景
-                Config.set_value('background_type', 'preset')
-                Config.set_value('background_preset', preset_bg)
-                Config.set_value('background_image', '')  # 清除自定义图片
-                
-                # 获取其他设置
+                # 使用预设背景（同时清除自定义图片）
                 time_based = request.form.get('time_based_background') == 'on'
-                Config.set_value('background_time_based', str(time_based))
+                Config.set_many({
+                    'background_type': 'preset',
+                    'background_preset': preset_bg,
+                    'background_image': '',
+                    'background_time_based': str(time_based)
+                })
                 
                 flash('预设背景设置成功！', 'success')
                 return redirect(url_for('admin.background_edit'))
@@ -1052,7 +1116,7 @@ def background_edit():
             # 处理时间变化开关（独立更新）
             if 'update_time_setting' in request.form:
                 time_based = request.form.get('time_based_background') == 'on'
-                Config.set_value('background_time_based', str(time_based))
+                Config.set_many({'background_time_based': str(time_based)})
                 flash('时间变化设置已更新！', 'success')
                 return redirect(url_for('admin.background_edit'))
             
@@ -1094,10 +1158,12 @@ def background_edit():
                         
                         # 保存新的背景图片配置
                         bg_url = f"/static/images/backgrounds/{unique_filename}"
-                        Config.set_value('background_type', 'custom')
-                        Config.set_value('background_image', bg_url)
-                        Config.set_value('background_blur_level', str(blur_level))
-                        Config.set_value('background_fit_mode', fit_mode)
+                        Config.set_many({
+                            'background_type': 'custom',
+                            'background_image': bg_url,
+                            'background_blur_level': str(blur_level),
+                            'background_fit_mode': fit_mode
+                        })
                         
                         flash('背景图片上传成功！', 'success')
                     else:
@@ -1118,8 +1184,10 @@ def background_edit():
                 if os.path.exists(file_path):
                     # 重新处理现有图片
                     if process_background_image(file_path, blur_level, fit_mode):
-                        Config.set_value('background_blur_level', str(blur_level))
-                        Config.set_value('background_fit_mode', fit_mode)
+                        Config.set_many({
+                            'background_blur_level': str(blur_level),
+                            'background_fit_mode': fit_mode
+                        })
                         flash('背景设置已更新！', 'success')
                     else:
                         flash('设置调整失败', 'danger')
@@ -1127,13 +1195,16 @@ def background_edit():
                     flash('背景图片文件不存在', 'danger')
             else:
                 # 只保存设置
-                Config.set_value('background_blur_level', str(blur_level))
-                Config.set_value('background_fit_mode', fit_mode)
+                Config.set_many({
+                    'background_blur_level': str(blur_level),
+                    'background_fit_mode': fit_mode
+                })
                 flash('背景设置已保存', 'info')
             
             return redirect(url_for('admin.background_edit'))
             
         except Exception as e:
+            db.session.rollback()
             flash(f'背景设置失败: {str(e)}', 'danger')
     
     # GET请求，显示设置页面
@@ -1175,16 +1246,19 @@ def reset_background():
                     pass
         
         # 清除所有背景相关配置
-        Config.set_value('background_type', 'custom')
-        Config.set_value('background_image', '')
-        Config.set_value('background_preset', 'sky')
-        Config.set_value('background_blur_level', '10')
-        Config.set_value('background_fit_mode', 'cover')
-        Config.set_value('background_time_based', 'False')
+        Config.set_many({
+            'background_type': 'custom',
+            'background_image': '',
+            'background_preset': 'sky',
+            'background_blur_level': '10',
+            'background_fit_mode': 'cover',
+            'background_time_based': 'False'
+        })
         
         return jsonify({'success': True, 'message': '背景已重置为默认'})
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'message': f'重置失败: {str(e)}'})
 
 
@@ -1282,6 +1356,7 @@ def approve_comment(comment_id):
         ).count()
         comment.article.comments_count = approved_count
         
+        bump_versions(VERSION_COMMENTS, comments_version_name(comment.article_id))
         db.session.commit()
         
         return jsonify({
@@ -1314,6 +1389,7 @@ def reject_comment(comment_id):
             ).count()
             comment.article.comments_count = approved_count - 1
         
+        bump_versions(VERSION_COMMENTS, comments_version_name(comment.article_id))
         db.session.commit()
         
         return jsonify({
@@ -1340,6 +1416,7 @@ def delete_comment(comment_id):
             comment.article.comments_count = max(0, comment.article.comments_count - 1)
         
         db.session.delete(comment)
+        bump_versions(VERSION_COMMENTS, comments_version_name(comment.article_id))
         db.session.commit()
         
         return jsonify({
@@ -1403,6 +1480,7 @@ def admin_reply_comment():
         # 更新文章评论数（管理员回复直接通过，计入评论数）
         parent_comment.article.comments_count += 1
         
+        bump_versions(VERSION_COMMENTS, comments_version_name(parent_comment.article_id))
         db.session.commit()
         
         return jsonify({
@@ -1472,6 +1550,8 @@ def batch_comment_action():
             except Exception as e:
                 continue  # 跳过失败的操作
         
+        article_ids = {comment.article_id for comment in comments}
+        bump_versions(VERSION_COMMENTS, *[comments_version_name(article_id) for article_id in article_ids])
         db.session.commit()
         
         action_names = {
@@ -1501,9 +1581,9 @@ def get_admin_location():
         if ip_address and ',' in ip_address:
             ip_address = ip_address.split(',')[0].strip()
         
-        # 获取地理位置信息
-        from ..utils import get_ip_location
-        location = get_ip_location(ip_address)
+        # 获取地理位置信息（带缓存）
+        from ..geo import geo_locator
+        location = geo_locator.locate(ip_address)
         
         return jsonify({
             'success': True,
@@ -1567,6 +1647,7 @@ def delete_music(music_id):
         # 删除数据库记录
         display_name = music.display_name
         db.session.delete(music)
+        bump_versions(VERSION_MUSIC)
         db.session.commit()
         
         return jsonify({
@@ -1594,6 +1675,7 @@ def edit_music(music_id):
             return jsonify({'success': False, 'message': '显示名称不能为空'})
         
         music.display_name = display_name
+        bump_versions(VERSION_MUSIC)
         db.session.commit()
         
         return jsonify({
@@ -1616,6 +1698,7 @@ def toggle_music_enabled(music_id):
         
         enabled = request.json.get('enabled', False)
         music.is_enabled = enabled
+        bump_versions(VERSION_MUSIC)
         db.session.commit()
         
         status_text = '已添加到前端播放列表' if enabled else '已从前端播放列表移除'
@@ -1646,14 +1729,17 @@ def music_settings():
             return redirect(url_for('admin.music'))
         
         # 保存设置
-        Config.set_value('music_enabled', str(enabled))
-        Config.set_value('music_auto_play', str(auto_play))
-        Config.set_value('music_default_volume', str(default_volume))
+        Config.set_many({
+            'music_enabled': str(enabled),
+            'music_auto_play': str(auto_play),
+            'music_default_volume': str(default_volume)
+        })
         
         flash('音乐设置已保存', 'success')
         return redirect(url_for('admin.music'))
         
     except Exception as e:
+        db.session.rollback()
         flash(f'保存设置失败: {str(e)}', 'danger')
         return redirect(url_for('admin.music'))
 
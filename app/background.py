@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+后台定时任务模块
+每个进程（gunicorn worker）按需启动一个守护线程，按配置的间隔执行任务；
+线程在首次使用时才启动，gunicorn预加载应用后fork出的worker也能正确运行
+"""
+
+import os
+import threading
+from . import db
+
+
+class PeriodicTask:
+    """按固定间隔在后台线程中执行的任务"""
+
+    def __init__(self, name, func, interval_config):
+        """
+        name: 线程名称；func: 任务函数（在应用上下文中调用）；
+        interval_config: 执行间隔（秒）对应的配置项，值为0时不启动后台线程
+        """
+        self.name = name
+        self.func = func
+        self.interval_config = interval_config
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """绑定应用"""
+        self._app = app
+
+    @property
+    def interval(self):
+        """执行间隔（秒），0表示不启用"""
+        if self._app is None:
+            return 0
+        return self._app.config.get(self.interval_config, 0)
+
+    def ensure_started(self):
+        """确保当前进程的后台线程已启动，未启用时返回False"""
+        if not self.interval:
+            return False
+
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return True
+
+        with self._lock:
+            if self._pid != pid or self._thread is None or not self._thread.is_alive():
+                self._pid = pid
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return True
+
+    def run_once(self):
+        """在应用上下文中执行一次任务，出错时回滚并记录日志"""
+        with self._app.app_context():
+            try:
+                return self.func()
+            except Exception:
+                db.session.rollback()
+                self._app.logger.exception(f'后台任务 {self.name} 执行失败')
+                return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def stop(self):
+        """停止后台线程（不等待当前执行结束）"""
+        self._stop.set()
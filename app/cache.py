@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+进程内缓存模块
+提供带过期时间的本地缓存，并通过数据库中的版本号实现跨进程（gunicorn多worker、多节点）失效：
+写操作在同一事务中递增相关版本号，读操作定期加载版本号，版本变化后旧缓存自动作废。
+同一套版本号也用于生成HTTP验证器（ETag / Last-Modified），支持条件请求返回304
+"""
+
+import time
+import hashlib
+import threading
+from datetime import timezone
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session, g
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from . import db
+from .utils import get_local_now
+
+
+# 缓存版本名称
+VERSION_ARTICLES = 'articles'  # 文章内容、状态、排序相关数据
+VERSION_TAGS = 'tags'          # 标签数据
+VERSION_COMMENTS = 'comments'  # 评论数据
+VERSION_CONFIG = 'config'      # 站点配置
+VERSION_MUSIC = 'music'        # 背景音乐列表
+VERSION_VISIT_ROLLUPS = 'visit_rollups'  # 前天及更早日期的访问统计汇总（重新汇总这些日期时变化）
+
+def comments_version_name(article_id):
+    """单篇文章评论的版本名称"""
+    return f'comments:{article_id}'
+
+
+# 整页缓存时忽略的查询参数（仅供前端脚本使用，不影响页面输出）
+PAGE_CACHE_IGNORED_ARGS = {'scroll_to_article', 'from_page'}
+
+
+class VersionRegistry:
+    """缓存版本号注册表：按固定间隔从数据库加载全部版本号"""
+
+    def __init__(self):
+        self._versions = {}
+        self._updated_at = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _check_interval(self):
+        return current_app.config.get('CACHE_VERSION_CHECK_INTERVAL', 5)
+
+    def _reload(self):
+        """从数据库加载全部版本号"""
+        from .models import CacheVersion
+
+        try:
+            rows = db.session.query(CacheVersion.name, CacheVersion.version, CacheVersion.updated_at).all()
+        except Exception:
+            # 版本表不可用时保留旧值，避免影响页面访问
+            db.session.rollback()
+            return
+
+        self._versions = {name: version for name, version, _ in rows}
+        self._updated_at = {name: updated_at for name, _, updated_at in rows}
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self._check_interval():
+            return
+
+        with self._lock:
+            if self._loaded_at is None or now - self._loaded_at >= self._check_interval():
+                self._reload()
+                self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """下次读取时强制重新加载版本号"""
+        self._loaded_at = None
+
+    def get(self, *names):
+        """获取一组版本号（元组），未记录的版本视为0"""
+        self._ensure_fresh()
+        return tuple(self._versions.get(name, 0) for name in names)
+
+    def get_updated_at(self, *names):
+        """获取一组版本中最近一次变更的时间，均未记录时返回None"""
+        self._ensure_fresh()
+        times = [self._updated_at[name] for name in names if self._updated_at.get(name)]
+        return max(times) if times else None
+
+
+class LocalCache:
+    """线程安全的进程内LRU缓存，条目带过期时间和依赖的版本号"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions=()):
+        """读取缓存，过期或版本不一致时返回None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            expires_at, entry_versions, value = entry
+            if expires_at < time.monotonic() or entry_versions != versions:
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, versions=(), timeout=300):
+        """写入缓存"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, versions, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """删除一条缓存"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+
+versions = VersionRegistry()
+local_cache = LocalCache()
+# 整页缓存单独使用一个实例，查询参数不同的页面再多也不会挤出配置快照等数据缓存
+page_cache = LocalCache()
+
+
+def get_or_set(key, factory, depends=(), timeout=300):
+    """读取缓存，未命中时调用factory生成并写入；depends为依赖的版本名称"""
+    current_versions = versions.get(*depends)
+    value = local_cache.get(key, current_versions)
+    if value is None:
+        value = factory()
+        local_cache.set(key, value, current_versions, timeout)
+    return value
+
+
+def page_cache_allowed():
+    """判断当前请求能否使用整页缓存：仅匿名GET请求，且会话中没有影响页面输出的状态"""
+    timeout = current_app.config.get('PAGE_CACHE_TIMEOUT', 0)
+    if not timeout or request.method != 'GET':
+        return False
+
+    # 管理员、已验证/已点赞文章的读者、有待显示提示消息的会话都直接渲染
+    for key in ('admin_logged_in', 'verified_articles', 'liked_articles', '_flashes'):
+        if session.get(key):
+            return False
+    return True
+
+
+def page_cache_key():
+    """根据路径和规范化后的查询参数生成整页缓存键"""
+    args = tuple(sorted(
+        (name, tuple(sorted(value for value in values if value)))
+        for name, values in request.args.lists()
+        if name not in PAGE_CACHE_IGNORED_ARGS and any(values)
+    ))
+    return ('page', request.path, args)
+
+
+def skip_page_cache():
+    """在视图中调用，标记本次响应不写入整页缓存"""
+    g.skip_page_cache = True
+
+
+def cache_page(depends=(), on_hit=None):
+    """
+    整页缓存装饰器（仅缓存模板渲染出的HTML字符串）
+    depends: 依赖的版本名称；
+    on_hit: 命中缓存时调用，用于补充视图中必须执行的副作用（如记录浏览数）
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not page_cache_allowed():
+                return view(*args, **kwargs)
+
+            key = page_cache_key()
+            current_versions = versions.get(*depends)
+
+            cached = page_cache.get(key, current_versions)
+            if cached is not None:
+                if on_hit:
+                    on_hit(**kwargs)
+                html, etag, last_modified = cached
+                if etag is None:
+                    return html
+                response = set_validators(current_app.make_response(html), etag, last_modified)
+                return response.make_conditional(request)
+
+            rv = view(*args, **kwargs)
+            if not g.get('skip_page_cache'):
+                cached = None
+                if isinstance(rv, str):
+                    cached = (rv, None, None)
+                elif getattr(rv, 'status_code', None) == 200 and rv.mimetype == 'text/html':
+                    cached = (rv.get_data(as_text=True), rv.get_etag()[0], rv.last_modified)
+                if cached is not None:
+                    page_cache.set(key, cached, current_versions, current_app.config['PAGE_CACHE_TIMEOUT'])
+            return rv
+        return wrapper
+    return decorator
+
+
+def make_etag(*parts):
+    """根据一组验证数据生成ETag"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def to_http_datetime(dt):
+    """将本地时间（naive datetime）转换为HTTP头使用的UTC时间（精确到秒）"""
+    if dt is None:
+        return None
+    return dt.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def set_validators(response, etag, last_modified=None):
+    """设置响应的验证器：弱ETag、Last-Modified，并要求客户端每次使用前重新验证"""
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """
+    条件请求检查，应在查询明细数据、渲染模板之前调用：
+    客户端缓存仍然有效时返回304响应，否则返回None。If-None-Match 优先于 If-Modified-Since
+    """
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matched = last_modified <= request.if_modified_since
+    else:
+        matched = False
+
+    if not matched:
+        return None
+
+    return set_validators(current_app.response_class(status=304), etag, last_modified)
+
+
+def bump_versions(*names):
+    """递增版本号，使依赖这些版本的缓存失效（随当前会话一起提交）"""
+    from .models import CacheVersion
+
+    now = get_local_now()
+    for name in names:
+        result = db.session.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == name)
+            .values(version=CacheVersion.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            db.session.add(CacheVersion(name=name, version=1, updated_at=now))
+
+    db.session.info['cache_versions_bumped'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _reload_versions_after_commit(db_session):
+    """本进程提交版本变更后立即生效，不等待下一次定期检查"""
+    if db_session.info.pop('cache_versions_bumped', False):
+        versions.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_versions_after_rollback(db_session):
+    """事务回滚时丢弃版本变更标记"""
+    db_session.info.pop('cache_versions_bumped', None)
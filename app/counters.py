@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+站点计数器模块
+将需要频繁展示的汇总值（如已发布文章总浏览量）保存为计数器，写操作时增量更新，
+读取时只查询一行，不再对整张表做聚合；计数器缺失时按需从明细数据重新计算
+"""
+
+from sqlalchemy import func, update
+from . import db
+from .utils import get_local_now
+
+
+# 计数器名称
+COUNTER_PUBLISHED_VIEWS = 'published_views'  # 已发布文章的总浏览量
+
+
+def _compute_published_views():
+    """从文章表重新计算已发布文章的总浏览量"""
+    from .models import Article
+
+    return db.session.query(func.sum(Article.view_count)).filter_by(status='published').scalar() or 0
+
+
+# 计数器名称 -> 重新计算函数
+COUNTER_LOADERS = {
+    COUNTER_PUBLISHED_VIEWS: _compute_published_views,
+}
+
+
+def increment_counter(name, amount):
+    """
+    原子增减计数器（随当前会话一起提交）
+    计数器尚未建立时不做处理，首次读取时会从明细数据完整计算，已包含本次变更
+    """
+    from .models import SiteCounter
+
+    if not amount:
+        return
+    db.session.execute(
+        update(SiteCounter)
+        .where(SiteCounter.name == name)
+        .values(value=SiteCounter.value + amount, updated_at=get_local_now())
+    )
+
+
+def set_counter(name, value):
+    """设置计数器的值，不存在时创建（随当前会话一起提交）"""
+    from .models import SiteCounter
+
+    counter = db.session.get(SiteCounter, name)
+    if counter is None:
+        counter = SiteCounter(name=name)
+        db.session.add(counter)
+    counter.value = value
+    counter.updated_at = get_local_now()
+    return counter
+
+
+def get_counter(name):
+    """读取计数器，不存在时从明细数据计算并保存"""
+    from .models import SiteCounter
+
+    value = db.session.query(SiteCounter.value).filter_by(name=name).scalar()
+    if value is not None:
+        return value
+
+    value = COUNTER_LOADERS[name]()
+    try:
+        set_counter(name, value)
+        db.session.commit()
+    except Exception:
+        # 并发创建等情况下写入失败不影响读取
+        db.session.rollback()
+    return value
+
+
+def reconcile_counters():
+    """按明细数据重新计算全部计数器，返回 {名称: (旧值, 新值)}"""
+    from .models import SiteCounter
+
+    results = {}
+    for name, loader in COUNTER_LOADERS.items():
+        old_value = db.session.query(SiteCounter.value).filter_by(name=name).scalar()
+        new_value = loader()
+        set_counter(name, new_value)
+        results[name] = (old_value, new_value)
+    db.session.commit()
+    return results
+
+
+def published_views_of(article):
+    """文章计入已发布总浏览量的部分（草稿不计入）"""
+    return (article.view_count or 0) if article.status == 'published' else 0
+
+
+def adjust_published_views(amount):
+    """调整已发布文章总浏览量（文章状态、浏览量变更或删除时调用）"""
+    increment_counter(COUNTER_PUBLISHED_VIEWS, amount)
@@ -2,15 +2,34 @@
 # -*- coding: utf-8 -*-
 
 # 前端视图函数
-from flask import render_template, request, abort, session, jsonify, url_for
+from flask import render_template, request, abort, session, jsonify, url_for, current_app, make_response
+from types import SimpleNamespace
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 from datetime import datetime, timedelta
 import re
-import markdown
 from . import frontend
 from ..models import Article, Tag, Config, Comment, Music
+from ..pagination import KeysetPagination, ListPagination, count_ahead
+from ..counters import get_counter, COUNTER_PUBLISHED_VIEWS
+from ..view_counter import view_buffer, write_view_counts
+from ..likes import add_like, get_likes_count
+from ..search import rank_articles, highlight, extract_snippet
+from ..suggest import suggestion_index
+from ..renderer import get_article_render, render_markdown, strip_content, build_preview
+from ..cache import (
+    versions, get_or_set, cache_page, skip_page_cache, bump_versions,
+    make_etag, to_http_datetime, set_validators, not_modified, comments_version_name,
+    VERSION_ARTICLES, VERSION_TAGS, VERSION_COMMENTS, VERSION_CONFIG, VERSION_MUSIC
+)
 from .. import db
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, defer
+
+
+# 整页缓存依赖的数据版本
+PAGE_CACHE_DEPENDS = (VERSION_ARTICLES, VERSION_TAGS, VERSION_COMMENTS, VERSION_CONFIG)
+
+# 文章列表排序键（均为降序）：置顶优先，然后按更新时间，id保证顺序稳定，同时作为游标分页的定位键
+ARTICLE_SEEK_COLUMNS = (Article.is_top, Article.updated_at, Article.id)
 
 
 def _build_back_url_with_position(referer_url, article_id):
@@ -128,7 +147,8 @@ def parse_custom_date(date_str):
 
 def build_article_query(time_range='all', custom_date='', tag_filter='', permission_filter='all'):
     """构建文章查询，应用所有筛选条件"""
-    query = Article.query.filter_by(status='published')
+    # 列表类查询使用预先生成的预览，不加载文章正文
+    query = Article.query.options(defer(Article.content)).filter_by(status='published')
     
     # 根据时间范围筛选
     if time_range == 'custom' and custom_date:
@@ -179,82 +199,201 @@ def build_article_query(time_range='all', custom_date='', tag_filter='', permiss
     return query
 
 
-@frontend.route('/')
-def index():
-    """首页视图 - 显示文章列表和分页"""
-    page = request.args.get('page', 1, type=int)
-    time_range = request.args.get('range', 'all')  # 时间范围筛选
-    custom_date = request.args.get('date', '')  # 自定义日期
-    tag_filter = request.args.get('tag', '')  # 标签筛选
-    permission_filter = request.args.get('permission', 'all')  # 权限筛选
-    timeline_order = request.args.get('timeline_order', 'updated')  # 时间线排序方式
-    per_page = 10  # 每页显示10篇文章
+def count_articles(query, total_key):
+    """获取筛选后的文章总数，按筛选条件缓存，文章或标签变更后失效"""
+    return get_or_set(
+        ('article_total',) + tuple(total_key),
+        lambda: query.order_by(None).count(),
+        depends=(VERSION_ARTICLES, VERSION_TAGS),
+        timeout=current_app.config.get('SIDEBAR_CACHE_TIMEOUT', 300)
+    )
+
+
+def paginate_articles(query, total_key, per_page=10):
+    """
+    按列表排序键对文章分页，返回 (分页对象, 分页方式)
+    URL带 after/before 游标（或配置为游标模式且未指定页码）时使用游标分页，否则沿用页码分页；
+    总条数按筛选条件缓存，文章变更后失效，不再每页执行 COUNT(*)
+    """
+    after = request.args.get('after', '')
+    before = request.args.get('before', '')
+    page = request.args.get('page', type=int)
     
-    # 构建基础查询（应用所有筛选条件）
-    base_query = build_article_query(time_range, custom_date, tag_filter, permission_filter)
+    cursor_mode = current_app.config.get('ARTICLE_PAGINATION_MODE', 'page') == 'cursor'
+    if page is None and (after or before or cursor_mode):
+        articles = KeysetPagination(
+            query.options(joinedload(Article.tags)),
+            ARTICLE_SEEK_COLUMNS,
+            per_page=per_page,
+            after=after,
+            before=before,
+            total=lambda: count_articles(query, total_key)
+        )
+        return articles, 'cursor'
     
-    # 获取已发布的文章列表，按置顶和时间排序
-    # 优化：预加载标签关联以减少N+1查询
-    articles = base_query.options(joinedload(Article.tags)).order_by(
-        Article.is_top.desc(),  # 置顶文章优先
-        Article.updated_at.desc()  # 然后按更新时间倒序
+    # 页码分页（兼容已有的书签和按页码跳转）
+    articles = query.options(joinedload(Article.tags)).order_by(
+        *[column.desc() for column in ARTICLE_SEEK_COLUMNS]
     ).paginate(
-        page=page,
+        page=page or 1,
         per_page=per_page,
-        error_out=False
+        error_out=False,
+        count=False
     )
+    articles.total = count_articles(query, total_key)
+    return articles, 'page'
+
+
+def search_article_ids(query, search_query, filter_key):
+    """按相关度排序的搜索结果文章ID列表，按搜索词和筛选条件缓存，文章或标签变更后失效"""
+    return get_or_set(
+        ('article_search', search_query) + tuple(filter_key),
+        lambda: rank_articles(search_query, candidate_query=query),
+        depends=(VERSION_ARTICLES, VERSION_TAGS),
+        timeout=current_app.config.get('SIDEBAR_CACHE_TIMEOUT', 300)
+    )
+
+
+def paginate_search_results(query, search_query, filter_key, per_page=10):
+    """对按相关度排序的搜索结果做页码分页，当前页的文章按相关度顺序返回"""
+    article_ids = search_article_ids(query, search_query, filter_key)
+    articles = ListPagination(article_ids, page=request.args.get('page', 1, type=int), per_page=per_page)
+    if articles.items:
+        loaded = {
+            article.id: article
+            for article in query.options(joinedload(Article.tags)).filter(Article.id.in_(articles.items))
+        }
+        articles.items = [loaded[article_id] for article_id in articles.items if article_id in loaded]
+    return articles
+
+
+def build_search_snippets(articles, search_query):
+    """为当前页的搜索结果提取正文中最匹配的高亮片段 {文章ID: 片段}，需验证且未验证的文章不提取"""
+    article_ids = [
+        article.id for article in articles
+        if article.permission != 'verify' or is_verified_filter(article.id)
+    ]
+    if not article_ids:
+        return {}
     
+    # 列表查询不加载正文，这里只取当前页文章的正文
+    rows = db.session.query(Article.id, Article.content).filter(Article.id.in_(article_ids)).all()
+    snippets = {}
+    for article_id, content in rows:
+        snippet = extract_snippet(strip_content(content), search_query)
+        if snippet:
+            snippets[article_id] = snippet
+    return snippets
+
+
+def _article_snapshot(article):
+    """提取侧边栏展示所需的文章字段（缓存跨请求共享，不能持有ORM对象）"""
+    return SimpleNamespace(
+        id=article.id,
+        title=article.title,
+        permission=article.permission,
+        is_top=article.is_top,
+        view_count=article.view_count,
+        likes_count=article.likes_count,
+        created_at=article.created_at,
+        updated_at=article.updated_at
+    )
+
+
+def _load_sidebar_data(time_range, custom_date, tag_filter, permission_filter, timeline_order):
+    """从数据库加载侧边栏数据"""
     # 获取所有标签（用于筛选器）
-    all_tags = Tag.query.order_by(Tag.name).all()
+    all_tags = [SimpleNamespace(id=tag.id, name=tag.name, color=tag.color)
+                for tag in Tag.query.order_by(Tag.name).all()]
     
     # 获取热门文章（按浏览量，应用相同的筛选条件）
-    top_articles = build_article_query(time_range, custom_date, tag_filter, permission_filter).options(joinedload(Article.tags)).order_by(
+    top_articles = build_article_query(time_range, custom_date, tag_filter, permission_filter).order_by(
         Article.view_count.desc()
     ).limit(5).all()
     
     # 获取时间线文章（应用相同的筛选条件，不受分页限制，用于导航）
     timeline_base_query = build_article_query(time_range, custom_date, tag_filter, permission_filter)
     if timeline_order == 'created':
-        timeline_articles = timeline_base_query.options(joinedload(Article.tags)).order_by(
+        timeline_articles = timeline_base_query.order_by(
             Article.is_top.desc(),
             Article.created_at.desc()
         ).limit(50).all()
     else:
-        timeline_articles = timeline_base_query.options(joinedload(Article.tags)).order_by(
+        timeline_articles = timeline_base_query.order_by(
             Article.is_top.desc(),
             Article.updated_at.desc()
         ).limit(50).all()
     
+    return {
+        'all_tags': all_tags,
+        'top_articles': [_article_snapshot(article) for article in top_articles],
+        'timeline_articles': [_article_snapshot(article) for article in timeline_articles]
+    }
+
+
+def get_sidebar_data(time_range, custom_date, tag_filter, permission_filter, timeline_order):
+    """获取首页/搜索页侧边栏数据，按筛选条件缓存，文章或标签变更后失效"""
+    cache_key = ('sidebar', time_range, custom_date, tag_filter, permission_filter, timeline_order)
+    sidebar = get_or_set(
+        cache_key,
+        lambda: _load_sidebar_data(time_range, custom_date, tag_filter, permission_filter, timeline_order),
+        depends=(VERSION_ARTICLES, VERSION_TAGS),
+        timeout=current_app.config.get('SIDEBAR_CACHE_TIMEOUT', 300)
+    )
+    
+    # 所有已发布文章的总浏览量（读取维护好的计数器，不缓存以保持实时）
+    return dict(sidebar, total_views=get_counter(COUNTER_PUBLISHED_VIEWS))
+
+
+@frontend.route('/')
+@cache_page(depends=PAGE_CACHE_DEPENDS)
+def index():
+    """首页视图 - 显示文章列表和分页"""
+    time_range = request.args.get('range', 'all')  # 时间范围筛选
+    custom_date = request.args.get('date', '')  # 自定义日期
+    tag_filter = request.args.get('tag', '')  # 标签筛选
+    permission_filter = request.args.get('permission', 'all')  # 权限筛选
+    timeline_order = request.args.get('timeline_order', 'updated')  # 时间线排序方式
+    per_page = 10  # 每页显示10篇文章
+    
+    # 构建基础查询（应用所有筛选条件）
+    base_query = build_article_query(time_range, custom_date, tag_filter, permission_filter)
+    
+    # 获取已发布的文章列表，按置顶和时间排序（预加载标签关联以减少N+1查询）
+    articles, pagination_mode = paginate_articles(
+        base_query,
+        ('', time_range, custom_date, tag_filter, permission_filter),
+        per_page=per_page
+    )
+    
+    # 获取侧边栏数据（标签、热门文章、时间线、总浏览量）
+    sidebar = get_sidebar_data(time_range, custom_date, tag_filter, permission_filter, timeline_order)
+    
     # 获取欢迎语配置
     welcome_title = Config.get_value('homepage_welcome_title', '欢迎来到我的个人博客')
     welcome_subtitle = Config.get_value('homepage_welcome_subtitle', '记录生活，分享想法，探索世界')
     
-    # 计算所有已发布文章的总浏览量
-    from sqlalchemy import func
-    total_views = db.session.query(func.sum(Article.view_count)).filter_by(status='published').scalar() or 0
-    
     # 获取背景配置
     background_config = get_current_background()
     
     return render_template(
         'frontend/index.html', 
         articles=articles, 
+        pagination_mode=pagination_mode,
         time_range=time_range, 
         custom_date=custom_date,
         tag_filter=tag_filter,
         permission_filter=permission_filter,
         timeline_order=timeline_order,
-        all_tags=all_tags,
-        top_articles=top_articles,
-        timeline_articles=timeline_articles,
         welcome_title=welcome_title,
         welcome_subtitle=welcome_subtitle,
         background_config=background_config,
-        total_views=total_views
+        **sidebar
     )
 
 
 @frontend.route('/search')
+@cache_page(depends=PAGE_CACHE_DEPENDS)
 def search():
     """搜索功能"""
     search_query = request.args.get('q', '').strip()
@@ -263,85 +402,94 @@ def search():
     tag_filter = request.args.get('tag', '')  # 标签筛选
     permission_filter = request.args.get('permission', 'all')  # 权限筛选
     timeline_order = request.args.get('timeline_order', 'updated')  # 时间线排序方式
-    page = request.args.get('page', 1, type=int)
     per_page = 10
     
     # 构建基础查询（应用所有筛选条件）
     base_query = build_article_query(time_range, custom_date, tag_filter, permission_filter)
     
     if search_query:
-        # 简化搜索：单关键词标题搜索，优化：预加载标签关联
-        articles = base_query.options(joinedload(Article.tags)).filter(Article.title.contains(search_query)).order_by(
-            Article.is_top.desc(),
-            Article.updated_at.desc()
-        ).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        # 全文搜索：按标题、摘要和正文的相关度排序
+        articles = paginate_search_results(
+            base_query,
+            search_query,
+            (time_range, custom_date, tag_filter, permission_filter),
+            per_page=per_page
         )
+        pagination_mode = 'page'
+        snippets = build_search_snippets(articles.items, search_query)
     else:
-        # 如果没有搜索词，返回所有已发布文章（带所有筛选），优化：预加载标签关联
-        articles = base_query.options(joinedload(Article.tags)).order_by(
-            Article.is_top.desc(),
-            Article.updated_at.desc()
-        ).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        # 无搜索词时返回所有已发布文章，带所有筛选
+        articles, pagination_mode = paginate_articles(
+            base_query,
+            ('', time_range, custom_date, tag_filter, permission_filter),
+            per_page=per_page
         )
+        snippets = {}
     
-    # 获取所有标签（用于筛选器）
-    all_tags = Tag.query.order_by(Tag.name).all()
-    
-    # 获取热门文章（按浏览量，应用相同的筛选条件）
-    top_articles = build_article_query(time_range, custom_date, tag_filter, permission_filter).options(joinedload(Article.tags)).order_by(
-        Article.view_count.desc()
-    ).limit(5).all()
-    
-    # 获取时间线文章（应用相同的筛选条件，不受分页限制，用于导航）
-    timeline_base_query = build_article_query(time_range, custom_date, tag_filter, permission_filter)
-    if timeline_order == 'created':
-        timeline_articles = timeline_base_query.options(joinedload(Article.tags)).order_by(
-            Article.is_top.desc(),
-            Article.created_at.desc()
-        ).limit(50).all()
-    else:
-        timeline_articles = timeline_base_query.options(joinedload(Article.tags)).order_by(
-            Article.is_top.desc(),
-            Article.updated_at.desc()
-        ).limit(50).all()
+    # 获取侧边栏数据（标签、热门文章、时间线、总浏览量）
+    sidebar = get_sidebar_data(time_range, custom_date, tag_filter, permission_filter, timeline_order)
     
     # 获取欢迎语配置
     welcome_title = Config.get_value('homepage_welcome_title', '欢迎来到我的个人博客')
     welcome_subtitle = Config.get_value('homepage_welcome_subtitle', '记录生活，分享想法，探索世界')
     
-    # 计算所有已发布文章的总浏览量
-    from sqlalchemy import func
-    total_views = db.session.query(func.sum(Article.view_count)).filter_by(status='published').scalar() or 0
-    
     # 获取背景配置
     background_config = get_current_background()
     
     return render_template(
         'frontend/index.html', 
         articles=articles, 
+        pagination_mode=pagination_mode,
+        snippets=snippets,
         search_query=search_query, 
         time_range=time_range, 
         custom_date=custom_date,
         tag_filter=tag_filter,
         permission_filter=permission_filter,
         timeline_order=timeline_order,
-        all_tags=all_tags,
-        top_articles=top_articles,
-        timeline_articles=timeline_articles,
         welcome_title=welcome_title,
         welcome_subtitle=welcome_subtitle,
         background_config=background_config,
-        total_views=total_views
+        **sidebar
     )
 
 
+def _get_return_url(article_id):
+    """
+    默认的返回URL（首页并定位到当前文章）
+    来源页面（from_page参数或Referer）由页面脚本在浏览器中处理，不参与整页缓存键和ETag
+    """
+    return url_for('frontend.index', scroll_to_article=article_id)
+
+
+def _latest_modified(*times):
+    """取一组时间中最晚的一个，转换为HTTP时间"""
+    times = [t for t in times if t is not None]
+    return to_http_datetime(max(times)) if times else None
+
+
+def _article_validators(article):
+    """文章详情页的验证器：文章更新时间、点赞数、文章评论版本、站点配置版本，以及影响页面输出的访客状态"""
+    depends = (VERSION_ARTICLES, VERSION_CONFIG, comments_version_name(article.id))
+    etag = make_etag(
+        'article', article.id, article.updated_at, get_likes_count(article.id), versions.get(*depends),
+        is_liked_filter(article.id)
+    )
+    last_modified = _latest_modified(article.updated_at, versions.get_updated_at(*depends))
+    return etag, last_modified
+
+
+def record_article_view(article_id):
+    """记录一次文章浏览：写入缓冲区由后台批量提交，未启用缓冲时直接原子自增"""
+    if not view_buffer.add(article_id):
+        write_view_counts({article_id: 1})
+
+
 @frontend.route('/article/<int:article_id>')
+@cache_page(
+    depends=PAGE_CACHE_DEPENDS,
+    on_hit=record_article_view
+)
 def article_detail(article_id):
     """文章详情页"""
     # 获取文章
@@ -377,56 +525,35 @@ def article_detail(article_id):
             
             # 构建带位置信息的返回URL
             back_url_with_position = _build_back_url_with_position(referer_url, article_id)
+            skip_page_cache()
             return render_template('frontend/verify.html', article=article, back_url=back_url_with_position)
     
-    # 生成文章内容和目录
-    article_html = ''
-    article_toc = ''
-    if article.content:
-        # 配置Markdown扩展，生成目录
-        md = markdown.Markdown(
-            extensions=[
-                'markdown.extensions.fenced_code',  # 代码块支持
-                'markdown.extensions.tables',       # 表格支持
-                'markdown.extensions.toc',          # 目录支持
-                'markdown.extensions.nl2br',        # 换行支持
-            ],
-            extension_configs={
-                'markdown.extensions.toc': {
-                    'title': '文章目录',
-                    'anchorlink': False,
-                    'permalink': False
-                }
-            }
-        )
-        
-        # 转换markdown
-        article_html = md.convert(article.content)
-        article_toc = md.toc
+    return_url_with_position = _get_return_url(article_id)
     
-    # 增加浏览数（只有成功访问文章时才增加）
-    article.view_count += 1
-    db.session.commit()
-    
-    # 获取来源页面信息并构建带位置信息的返回URL
-    # 优先使用from_page参数，然后是referrer
-    from_page = request.args.get('from_page')
-    if from_page:
-        referrer_url = from_page
-    else:
-        referrer_url = request.referrer or url_for('frontend.index')
+    # 条件请求：浏览器缓存仍然有效时直接返回304，不再渲染Markdown和模板
+    etag, last_modified = _article_validators(article)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        record_article_view(article_id)
+        return response
     
-    return_url_with_position = _build_back_url_with_position(referrer_url, article_id)
+    # 生成文章内容和目录（优先读取渲染缓存）
+    article_html, article_toc = get_article_render(article)
+    
+    # 增加浏览数（只有成功访问文章时才增加）
+    record_article_view(article_id)
     
     # 获取背景配置
     background_config = get_current_background()
     
-    return render_template('frontend/article.html', 
-                         article=article, 
-                         article_html=article_html,
-                         article_toc=article_toc,
-                         background_config=background_config,
-                         return_url=return_url_with_position)
+    response = make_response(render_template('frontend/article.html', 
+                                             article=article, 
+                                             article_html=article_html,
+                                             article_toc=article_toc,
+                                             likes_count=get_likes_count(article.id),
+                                             background_config=background_config,
+                                             return_url=return_url_with_position))
+    return set_validators(response, etag, last_modified)
 
 
 @frontend.route('/verify_article', methods=['POST'])
@@ -483,9 +610,9 @@ def get_user_location():
         if ip_address and ',' in ip_address:
             ip_address = ip_address.split(',')[0].strip()
         
-        # 获取地理位置信息
-        from ..utils import get_ip_location
-        location = get_ip_location(ip_address)
+        # 获取地理位置信息（带缓存）
+        from ..geo import geo_locator
+        location = geo_locator.locate(ip_address)
         
         return jsonify({
             'success': True,
@@ -514,98 +641,112 @@ def get_comments(article_id):
         page = request.args.get('page', 1, type=int)
         per_page = 10  # 每页10条评论
         
-        # 构建基础查询
-        query = Comment.query.options(db.joinedload(Comment.article)).filter_by(
-            article_id=article_id, 
-            status='approved'
+        # 条件请求：评论未变化时直接返回304，不再查询评论
+        # 相对时间（如"5分钟前"）按小时纳入验证器，避免长期返回过时的显示文本
+        comments_version = comments_version_name(article_id)
+        etag = make_etag(
+            'comments', article_id, page, versions.get(comments_version),
+            datetime.now().strftime('%Y%m%d%H')
+        )
+        last_modified = _latest_modified(versions.get_updated_at(comments_version))
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+        
+        # 构建基础查询（只取序列化需要的列）
+        query = Comment.row_query().filter(
+            Comment.article_id == article_id, 
+            Comment.status == 'approved'
         ).order_by(Comment.created_at.desc())
         
-        # 分别处理顶层评论和回复评论
-        # 顶层评论（用于分页）
-        root_comments_query = query.filter(Comment.parent_id.is_(None))
+        # 顶层评论数和回复数一次分组查询，同时用于分页
+        total_root_comments, total_replies = Comment.approved_counts(article_id)
+        total_all_comments = total_root_comments + total_replies
         
-        # 使用分页获取顶层评论
-        root_comments_page = root_comments_query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        # 顶层评论分页（直接 LIMIT/OFFSET，不再额外 COUNT）
+        page = max(page, 1)
+        total_pages = (total_root_comments + per_page - 1) // per_page
+        root_comments = query.filter(Comment.parent_id.is_(None))\
+            .limit(per_page).offset((page - 1) * per_page).all()
         
-        root_comments = root_comments_page.items
+        pagination = {
+            'current_page': page,
+            'total_pages': total_pages,
+            'per_page': per_page,
+            'total': total_root_comments,
+            'has_prev': page > 1,
+            'has_next': page < total_pages,
+            'prev_page': page - 1 if page > 1 else None,
+            'next_page': page + 1 if page < total_pages else None
+        }
         
         if not root_comments:
-            return jsonify({
+            return set_validators(jsonify({
                 'success': True,
                 'comments': [],
-                'pagination': {
-                    'current_page': page,
-                    'total_pages': root_comments_page.pages,
-                    'per_page': per_page,
-                    'total': root_comments_page.total,
-                    'has_prev': root_comments_page.has_prev,
-                    'has_next': root_comments_page.has_next,
-                    'prev_page': root_comments_page.prev_num,
-                    'next_page': root_comments_page.next_num
-                },
+                'pagination': pagination,
                 'stats': {
                     'total_comments': 0,
                     'root_comments': 0,
                     'replies': 0
                 }
-            })
+            }), etag, last_modified)
         
-        # 获取当前页顶层评论的所有回复（优化：一次查询）
-        root_comment_ids = [comment.id for comment in root_comments]
-        all_replies = Comment.query.filter(
-            Comment.parent_id.in_(root_comment_ids),
-            Comment.status == 'approved'
-        ).order_by(Comment.created_at.asc()).all()
+        # 当前页顶层评论的整个线程（各级回复）：按物化路径一次索引范围扫描取出
+        # （顶层评论的路径只由其ID决定，顶层评论自身缺少路径时同样可以计算）
+        root_paths = {Comment.build_thread_path('', comment.id) for comment in root_comments}
+        lower, upper = Comment.thread_range(root_paths)
+        all_replies = query.filter(
+            Comment.parent_id.isnot(None),
+            Comment.thread_path > lower,
+            Comment.thread_path < upper
+        ).order_by(None).all()
+        
+        # 范围内可能夹有不在当前页的线程，按顶层路径过滤
+        root_length = Comment.THREAD_PATH_DIGITS + 1
+        all_replies = [reply for reply in all_replies if reply.thread_path[:root_length] in root_paths]
+        
+        # 还没有路径的回复（未执行 --upgrade 回填的旧数据等）按 parent_id 挂到父评论下，不会丢失
+        all_replies.extend(query.filter(
+            Comment.parent_id.isnot(None),
+            Comment.thread_path.is_(None)
+        ).order_by(None).all())
+        
+        # 按ID排序即为线程顺序：父评论总在回复之前，同级回复按发表先后
+        all_replies.sort(key=lambda reply: reply.id)
+        
+        # 顶层评论和回复一起序列化，回复数一次分组查询
+        from ..utils import format_relative_time
+        rows = list(root_comments) + all_replies
+        serialized = Comment.bulk_to_dicts(rows)
+        for comment_dict, row in zip(serialized, rows):
+            comment_dict['time_display'] = format_relative_time(row.created_at)
+            comment_dict['replies'] = []
+        
+        # 按线程顺序把回复挂到父评论下（一次遍历）；上级评论未通过审核时不显示
+        visible = {comment_dict['id']: comment_dict for comment_dict in serialized[:len(root_comments)]}
+        for reply_dict in serialized[len(root_comments):]:
+            parent = visible.get(reply_dict['parent_id'])
+            if parent is not None:
+                parent['replies'].append(reply_dict)
+                visible[reply_dict['id']] = reply_dict
         
         # 构建评论数据结构
         comments_data = []
-        
-        # 为每个顶层评论构建完整的数据（包括回复）
-        for root_comment in root_comments:
-            comment_dict = root_comment.to_dict()
-            # 添加格式化的时间显示
-            from ..utils import format_relative_time
-            comment_dict['time_display'] = format_relative_time(root_comment.created_at)
-            
-            # 添加该评论的所有回复
-            comment_replies = [reply for reply in all_replies if reply.parent_id == root_comment.id]
-            reply_data = []
-            for reply in comment_replies:
-                reply_dict = reply.to_dict()
-                reply_dict['time_display'] = format_relative_time(reply.created_at)
-                reply_data.append(reply_dict)
-            
-            comment_dict['replies'] = reply_data
-            comment_dict['has_replies'] = len(reply_data) > 0
+        for comment_dict in serialized[:len(root_comments)]:
+            comment_dict['has_replies'] = len(comment_dict['replies']) > 0
             comments_data.append(comment_dict)
         
-        # 获取统计信息
-        total_root_comments = root_comments_query.count()
-        total_all_comments = query.count()
-        
-        return jsonify({
+        return set_validators(jsonify({
             'success': True,
             'comments': comments_data,
-            'pagination': {
-                'current_page': page,
-                'total_pages': root_comments_page.pages,
-                'per_page': per_page,
-                'total': total_root_comments,
-                'has_prev': root_comments_page.has_prev,
-                'has_next': root_comments_page.has_next,
-                'prev_page': root_comments_page.prev_num,
-                'next_page': root_comments_page.next_num
-            },
+            'pagination': pagination,
             'stats': {
                 'total_comments': total_all_comments,
                 'root_comments': total_root_comments,
-                'replies': total_all_comments - total_root_comments
+                'replies': total_replies
             }
-        })
+        }), etag, last_modified)
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取评论失败: {str(e)}'})
@@ -664,9 +805,9 @@ def add_comment(article_id):
         if ip_address and ',' in ip_address:
             ip_address = ip_address.split(',')[0].strip()
         
-        # 获取地理位置信息
-        from ..utils import get_ip_location
-        location = get_ip_location(ip_address)
+        # 获取地理位置信息：只查缓存和本地IP数据库，查不到时提交后由后台回填，不等待在线接口
+        from ..geo import geo_locator
+        location = geo_locator.cached(ip_address)
         
         # 创建评论记录
         comment = Comment(
@@ -686,8 +827,12 @@ def add_comment(article_id):
         if hasattr(article, 'comments_count'):
             article.comments_count = article.comments.count() + 1
         
+        bump_versions(VERSION_COMMENTS, comments_version_name(article_id))
         db.session.commit()
         
+        if location is None:
+            geo_locator.resolve_later(comment.id, article_id, ip_address)
+        
         # 根据是否私密评论和是否回复返回不同消息
         if parent_id:
             # 这是一个回复
@@ -739,21 +884,18 @@ def like_article(article_id):
         if article_id in liked_articles:
             return jsonify({'success': False, 'message': '您已经为这篇文章点过赞了'})
         
-        # 增加点赞数
-        article.likes_count += 1
+        # 增加点赞数（写入分片计数，避免热门文章的并发点赞争抢同一行）
+        likes_count = add_like(article_id)
         
         # 记录到session
         liked_articles.append(article_id)
         session['liked_articles'] = liked_articles
         session.permanent = True
         
-        # 保存到数据库
-        db.session.commit()
-        
         return jsonify({
             'success': True,
             'message': '点赞成功',
-            'likes_count': article.likes_count
+            'likes_count': likes_count
         })
         
     except Exception as e:
@@ -770,34 +912,36 @@ def get_article_page(article_id):
         custom_date = request.args.get('date', '')
         tag_filter = request.args.get('tag', '')
         permission_filter = request.args.get('permission', 'all')
-        search_query = request.args.get('q', '')
+        search_query = request.args.get('q', '').strip()
         per_page = 10
         
         # 构建基础查询（使用统一的查询构建函数）
         base_query = build_article_query(time_range, custom_date, tag_filter, permission_filter)
         
-        # 应用搜索筛选
-        if search_query:
-            base_query = base_query.filter(Article.title.contains(search_query))
-        
-        # 按置顶和更新时间排序（与首页排序逻辑保持一致）
-        ordered_query = base_query.order_by(
-            Article.is_top.desc(),
-            Article.updated_at.desc()
-        )
+        filter_key = (time_range, custom_date, tag_filter, permission_filter)
         
-        # 获取所有符合条件的文章ID列表
-        all_article_ids = [article.id for article in ordered_query.all()]
-        
-        # 检查目标文章是否在结果中
-        if article_id not in all_article_ids:
-            return jsonify({
-                'success': False, 
-                'message': '文章在当前筛选条件下不可见'
-            })
-        
-        # 计算文章在结果中的位置（从0开始）
-        article_position = all_article_ids.index(article_id)
+        if search_query:
+            # 搜索结果按相关度排序，位置即文章在结果列表中的下标
+            article_ids = search_article_ids(base_query, search_query, filter_key)
+            if article_id not in article_ids:
+                return jsonify({
+                    'success': False, 
+                    'message': '文章在当前筛选条件下不可见'
+                })
+            article_position = article_ids.index(article_id)
+            total = len(article_ids)
+        else:
+            # 取出目标文章的排序键（同时确认它在当前筛选条件下可见）
+            seek_key = base_query.filter(Article.id == article_id).with_entities(*ARTICLE_SEEK_COLUMNS).first()
+            if seek_key is None:
+                return jsonify({
+                    'success': False, 
+                    'message': '文章在当前筛选条件下不可见'
+                })
+            
+            # 统计排序在目标文章之前的文章数（与首页排序逻辑保持一致），即文章位置（从0开始）
+            article_position = count_ahead(base_query, ARTICLE_SEEK_COLUMNS, list(seek_key))
+            total = count_articles(base_query, ('',) + filter_key)
         
         # 计算页码（从1开始）
         page_number = (article_position // per_page) + 1
@@ -806,7 +950,7 @@ def get_article_page(article_id):
             'success': True,
             'page': page_number,
             'position': article_position + 1,
-            'total': len(all_article_ids)
+            'total': total
         })
         
     except Exception as e:
@@ -823,25 +967,8 @@ def markdown_filter(text):
     if not text:
         return ''
     
-    # 配置Markdown扩展
-    md = markdown.Markdown(
-        extensions=[
-            'markdown.extensions.fenced_code',  # 代码块支持
-            'markdown.extensions.tables',       # 表格支持
-            'markdown.extensions.toc',          # 目录支持
-            'markdown.extensions.nl2br',        # 换行支持
-        ],
-        extension_configs={
-            'markdown.extensions.toc': {
-                'title': '文章目录',
-                'anchorlink': False,
-                'permalink': False
-            }
-        }
-    )
-    
-    # 转换markdown并保留HTML标签
-    html = md.convert(text)
+    # 使用线程内复用的Markdown实例渲染
+    html, _ = render_markdown(text)
     return html
 
 # 添加内容预览过滤器
@@ -851,30 +978,8 @@ def preview_filter(text, lines=2):
     if not text:
         return ''
     
-    import re
-    
-    # 先处理HTML img标签，替换为[图片]
-    text = re.sub(r'<img[^>]*>', '[图片]', text)
-    
-    # 处理markdown图片语法，替换为[图片]
-    text = re.sub(r'!\[[^\]]*\]\([^\)]*\)', '[图片]', text)
-    
-    # 移除其他HTML标签
-    text = re.sub(r'<[^>]+>', '', text)
-    
-    # 按行分割
-    lines_list = text.split('\n')
-    preview_lines = []
-    
-    count = 0
-    for line in lines_list:
-        if line.strip():  # 只计算非空行
-            preview_lines.append(line.strip())
-            count += 1
-            if count >= lines:
-                break
-    
-    return '\n'.join(preview_lines) + ('...' if count >= lines else '')
+    # 列表页已改为读取保存时生成的 Article.preview，此过滤器保留给模板按需使用
+    return build_preview(strip_content(text), lines)
 
 # 添加验证状态检查函数
 @frontend.app_template_filter('is_verified')
@@ -904,37 +1009,46 @@ def is_liked_filter(article_id):
 # 添加搜索关键词高亮过滤器
 @frontend.app_template_filter('highlight_search')
 def highlight_search_filter(text, search_query):
-    """高亮显示搜索关键词"""
+    """高亮显示搜索关键词（单次扫描，保留原文大小写）"""
     if not search_query or not text:
         return text
     
-    import re
-    from markupsafe import Markup
-    
-    # 将搜索词按空格分割
-    search_terms = search_query.split()
-    highlighted_text = text
-    
-    for term in search_terms:
-        if term.strip():
-            # 忽略大小写的正则匹配
-            pattern = re.compile(re.escape(term), re.IGNORECASE)
-            highlighted_text = pattern.sub(
-                f'<mark class="search-highlight">{term}</mark>', 
-                highlighted_text
-            )
+    return highlight(text, search_query)
+
+
+@frontend.route('/api/search/suggest')
+def search_suggest():
+    """搜索建议API：根据输入前缀返回匹配的标签和文章标题（从进程内索引读取，不查询数据库）"""
+    query = request.args.get('q', '').strip()[:100]
+    suggestions = suggestion_index.suggest(query)
+    for suggestion in suggestions:
+        if suggestion['type'] == 'tag':
+            suggestion['url'] = url_for('frontend.index', tag=suggestion['text'])
+        else:
+            suggestion['url'] = url_for('frontend.article_detail', article_id=suggestion['id'])
     
-    return Markup(highlighted_text) 
+    return jsonify({
+        'success': True,
+        'suggestions': suggestions
+    })
 
 
 @frontend.route('/api/music/list')
 def get_music_list():
     """获取音乐列表API"""
     try:
+        # 条件请求：音乐列表和音乐配置未变化时直接返回304
+        depends = (VERSION_MUSIC, VERSION_CONFIG)
+        etag = make_etag('music', versions.get(*depends))
+        last_modified = _latest_modified(versions.get_updated_at(*depends))
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+        
         # 检查音乐功能是否启用
         music_enabled = Config.get_value('music_enabled', 'True') == 'True'
         if not music_enabled:
-            return jsonify({
+            return set_validators(jsonify({
                 'success': True,
                 'music_list': [],
                 'config': {
@@ -942,7 +1056,7 @@ def get_music_list():
                     'auto_play': False,
                     'default_volume': 0.5
                 }
-            })
+            }), etag, last_modified)
         
         # 获取所有启用的音乐文件
         music_files = Music.query.filter_by(is_enabled=True).order_by(Music.created_at.desc()).all()
@@ -961,7 +1075,7 @@ def get_music_list():
                 'file_size_mb': music.file_size_mb
             })
         
-        return jsonify({
+        return set_validators(jsonify({
             'success': True,
             'music_list': music_list,
             'config': {
@@ -969,7 +1083,7 @@ def get_music_list():
                 'auto_play': music_auto_play,
                 'default_volume': music_default_volume
             }
-        })
+        }), etag, last_modified)
         
     except Exception as e:
         return jsonify({
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+IP归属地查询模块
+查询结果放入进程内 LRU + 过期时间 缓存；本地IP数据库可用时直接查询（微秒级），
+否则请求中不等待在线接口：评论先保存，提交后由后台线程查询归属地并回填 Comment.location。
+在线接口连续失败达到阈值后熔断一段时间，期间不再请求；查询失败的评论按指数退避稍后重试。
+命中、未命中和接口耗时均有计数
+"""
+
+import os
+import time
+import queue
+import threading
+from collections import defaultdict
+from flask import current_app
+from . import db
+from .background import PeriodicTask
+from .cache import LocalCache, bump_versions, comments_version_name, VERSION_COMMENTS
+from .utils import is_local_ip, lookup_local_ip_location, fetch_ip_location
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却时间过后放行一次试探请求，成功则关闭"""
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.open_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return 'closed' if self.opened_at is None else 'open'
+
+    def allow(self, cooldown):
+        """是否允许发起请求"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= cooldown:
+                # 试探期间其他请求仍被拒绝，直到试探结果返回
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self, threshold):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= threshold:
+                if self.opened_at is None:
+                    self.open_count += 1
+                self.opened_at = time.monotonic()
+
+
+class GeoLocator:
+    """IP归属地查询：缓存 + 后台回填 + 熔断"""
+
+    def __init__(self):
+        self._app = None
+        self._cache = LocalCache()
+        self._queue = None
+        self._retries = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        self._breaker = CircuitBreaker()
+        self._counters = {
+            'hits': 0,             # 缓存命中
+            'local': 0,            # 本地IP数据库查询
+            'misses': 0,           # 需要请求在线接口
+            'remote_calls': 0,     # 在线接口请求次数
+            'remote_failures': 0,  # 在线接口失败次数
+            'breaker_skipped': 0,  # 熔断期间跳过的查询
+            'deferred': 0,         # 转入后台回填的评论
+            'dropped': 0,          # 队列满丢弃的评论
+            'resolved': 0,         # 后台回填成功的评论
+            'retried': 0,          # 查询失败后安排重试的次数
+            'abandoned': 0,        # 重试次数用尽仍未回填的评论
+        }
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._task = PeriodicTask('geo-resolver', self._resolve_queued, 'GEO_RESOLVE_INTERVAL')
+
+    def init_app(self, app):
+        """绑定应用"""
+        self._app = app
+        self._cache = LocalCache(max_entries=app.config.get('GEO_CACHE_SIZE', 10000))
+        self._task.init_app(app)
+        app.extensions['geo_locator'] = self
+
+    def _ensure_process(self):
+        """按进程初始化回填队列和重试表（fork后不沿用父进程的）"""
+        pid = os.getpid()
+        if self._pid != pid:
+            self._queue = queue.Queue(maxsize=self._app.config.get('GEO_QUEUE_SIZE', 1000))
+            self._retries = {}
+            self._pid = pid
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _lookup_fast(self, ip_address):
+        """不访问网络的查询：本机地址、缓存、本地IP数据库，返回 (归属地, 来源)，都没有时归属地为None"""
+        if is_local_ip(ip_address):
+            return '本地', 'hits'
+
+        location = self._cache.get(ip_address)
+        if location is not None:
+            return location, 'hits'
+
+        location = lookup_local_ip_location(ip_address)
+        if location is not None:
+            self._cache.set(ip_address, location, timeout=current_app.config.get('GEO_CACHE_TIMEOUT', 86400))
+            return location, 'local'
+        return None, 'misses'
+
+    def _fetch(self, ip_address):
+        """请求在线接口（受熔断器控制），失败或熔断时返回None"""
+        config = current_app.config
+        if not config.get('IP_LOCATION_ONLINE_LOOKUP', True):
+            return '未知地区'
+
+        if not self._breaker.allow(config.get('GEO_BREAKER_COOLDOWN', 60)):
+            self._count('breaker_skipped')
+            return None
+
+        start = time.perf_counter()
+        try:
+            location = fetch_ip_location(ip_address, timeout=config.get('GEO_REQUEST_TIMEOUT', 3))
+        except Exception as e:
+            self._breaker.record_failure(config.get('GEO_BREAKER_THRESHOLD', 5))
+            self._count('remote_failures')
+            current_app.logger.warning(f'查询IP归属地失败: {ip_address}: {str(e)}')
+            return None
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._counters['remote_calls'] += 1
+                self._latency_total += elapsed
+                self._latency_max = max(self._latency_max, elapsed)
+
+        self._breaker.record_success()
+        self._cache.set(ip_address, location, timeout=config.get('GEO_CACHE_TIMEOUT', 86400))
+        return location
+
+    def cached(self, ip_address):
+        """只查询缓存和本地IP数据库（不访问网络），没有结果时返回None"""
+        location, source = self._lookup_fast(ip_address)
+        self._count(source)
+        return location
+
+    def locate(self, ip_address):
+        """查询归属地，缓存未命中时同步请求在线接口（受熔断器控制），查询不到时返回“未知地区”"""
+        location = self.cached(ip_address)
+        if location is None:
+            location = self._fetch(ip_address)
+        return location or '未知地区'
+
+    def resolve_later(self, comment_id, article_id, ip_address):
+        """评论提交后调用：由后台线程查询归属地并回填到评论"""
+        with self._lock:
+            self._ensure_process()
+        try:
+            self._queue.put_nowait((comment_id, article_id, ip_address))
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('deferred')
+
+        # 未启用后台线程时立即回填
+        if not self._task.ensure_started():
+            self.flush()
+        return True
+
+    def _schedule_retry(self, ip_address, comments, attempts):
+        """查询失败的评论按指数退避稍后重试，超过重试次数后放弃（归属地留空）"""
+        config = current_app.config
+        if attempts > config.get('GEO_RETRY_LIMIT', 5):
+            self._count('abandoned', len(comments))
+            return
+
+        delay = min(config.get('GEO_RETRY_DELAY', 30) * 2 ** (attempts - 1), config.get('GEO_RETRY_MAX_DELAY', 900))
+        with self._lock:
+            # 同一IP已有等待中的重试时合并（新查询的评论沿用已有的重试时间）
+            if ip_address in self._retries:
+                _, retry_at, waiting = self._retries[ip_address]
+                self._retries[ip_address] = (attempts, retry_at, waiting + comments)
+            else:
+                self._retries[ip_address] = (attempts, time.monotonic() + delay, comments)
+        self._count('retried')
+
+    def _take_due_retries(self):
+        """取出已到重试时间的条目 {IP: (已失败次数, 评论列表)}"""
+        now = time.monotonic()
+        with self._lock:
+            due = {ip_address: (attempts, comments)
+                   for ip_address, (attempts, retry_at, comments) in self._retries.items() if retry_at <= now}
+            for ip_address in due:
+                del self._retries[ip_address]
+        return due
+
+    def _resolve_queued(self):
+        """取出队列中的评论和到期的重试，按IP查询归属地（同一IP只查一次）并回填，返回回填的评论数"""
+        from .models import Comment
+
+        if self._queue is None or self._pid != os.getpid():
+            return 0
+
+        pending = defaultdict(list)
+        attempts = defaultdict(int)
+        for ip_address, (failed, comments) in self._take_due_retries().items():
+            pending[ip_address].extend(comments)
+            attempts[ip_address] = failed
+        while True:
+            try:
+                comment_id, article_id, ip_address = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pending[ip_address].append((comment_id, article_id))
+
+        resolved = 0
+        article_ids = set()
+        for ip_address, comments in pending.items():
+            location, _ = self._lookup_fast(ip_address)
+            if location is None:
+                location = self._fetch(ip_address)
+            if location is None:
+                # 接口失败或熔断中，稍后重试
+                self._schedule_retry(ip_address, comments, attempts[ip_address] + 1)
+                continue
+
+            resolved += Comment.query.filter(
+                Comment.id.in_([comment_id for comment_id, _ in comments]),
+                Comment.location.is_(None)
+            ).update({Comment.location: location}, synchronize_session=False)
+            article_ids.update(article_id for _, article_id in comments)
+
+        if article_ids:
+            # 评论列表按版本号缓存，回填后使其失效
+            bump_versions(VERSION_COMMENTS, *[comments_version_name(article_id) for article_id in article_ids])
+        db.session.commit()
+
+        self._count('resolved', resolved)
+        return resolved
+
+    def flush(self):
+        """立即回填队列中的全部评论"""
+        return self._task.run_once() or 0
+
+    def get_stats(self):
+        """当前进程的查询计数、在线接口平均/最大耗时（毫秒）和熔断状态"""
+        with self._lock:
+            stats = dict(self._counters)
+            calls = stats['remote_calls']
+            stats['avg_latency_ms'] = round(self._latency_total / calls * 1000, 1) if calls else 0
+            stats['max_latency_ms'] = round(self._latency_max * 1000, 1)
+            current = self._queue is not None and self._pid == os.getpid()
+            stats['queued'] = self._queue.qsize() if current else 0
+            stats['retrying'] = sum(len(comments) for _, _, comments in self._retries.values()) if current else 0
+        stats['breaker_state'] = self._breaker.state
+        stats['breaker_opened'] = self._breaker.open_count
+        return stats
+
+
+geo_locator = GeoLocator()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HyperLogLog 基数估计模块
+用于估算独立访客数：每天的访客IP汇总为一个固定大小的概要（sketch），
+多天的概要按寄存器取最大值即可合并，任意日期范围的独立访客数都能在常数时间内估算。
+
+精度说明：寄存器数 m = 2^p，标准误差约为 1.04 / sqrt(m)。
+默认 p = 12（4096 个寄存器，每个概要压缩前 4KB），标准误差约 1.6%，
+即约 95% 的估算结果与真实值的偏差在 ±3.3% 以内；基数较小时使用线性计数修正，结果接近精确值
+"""
+
+import math
+import zlib
+import hashlib
+
+
+# 默认精度（寄存器数为 2^HLL_PRECISION）
+HLL_PRECISION = 12
+
+
+def _hash64(value):
+    """计算64位哈希值"""
+    digest = hashlib.sha1(str(value).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计概要"""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.size)
+        else:
+            if len(registers) != self.size:
+                raise ValueError('寄存器数量与精度不匹配')
+            self.registers = bytearray(registers)
+
+    @property
+    def error_rate(self):
+        """理论标准误差"""
+        return 1.04 / math.sqrt(self.size)
+
+    def add(self, value):
+        """加入一个元素"""
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        # 剩余位中第一个1出现的位置（从1开始）
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """合并另一个概要（并集），返回自身"""
+        if other.precision != self.precision:
+            raise ValueError('只能合并相同精度的概要')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """估算元素个数"""
+        m = self.size
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+
+        # 小基数时使用线性计数修正
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """序列化为压缩后的字节串（用于保存到数据库）"""
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=HLL_PRECISION):
+        """从 to_bytes 的结果还原"""
+        return cls(precision, zlib.decompress(data))
+
+    @classmethod
+    def merge_all(cls, sketches, precision=HLL_PRECISION):
+        """合并多个序列化的概要，忽略空值"""
+        merged = cls(precision)
+        for data in sketches:
+            if data:
+                merged.merge(cls.from_bytes(data, precision))
+        return merged
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+离线IP归属地数据库模块
+将常见CSV格式的IP段数据编译为紧凑的二进制文件：IPv4、IPv6 各一个按起始地址排序的定长记录数组
+（起始地址、结束地址均为大端整数，按字节比较即按数值比较），外加归属地名称表。
+查询时以只读方式 mmap 映射文件，在记录数组上二分查找，单次查询为微秒级，不访问网络
+"""
+
+import os
+import csv
+import json
+import mmap
+import struct
+import threading
+import ipaddress
+from bisect import bisect_right
+
+
+FILE_MAGIC = b'RLIPDB1\x00'
+# 文件头：魔数、IPv4记录数、IPv6记录数、名称表偏移、名称表长度
+HEADER = struct.Struct('<8sIIQQ')
+# 每条记录：起始地址、结束地址（大端）、名称表下标
+RECORD_FORMATS = {
+    4: struct.Struct('>4s4sI'),
+    6: struct.Struct('>16s16sI'),
+}
+
+
+def format_location(country, region=''):
+    """
+    将国家和省份/州格式化为评论等处显示的归属地：
+    中国显示省份（补全“省”字），其他国家显示国家名
+    """
+    country = (country or '').strip()
+    region = (region or '').strip()
+
+    if country in ('中国', 'China', 'CN'):
+        if region and region != country:
+            if region.endswith(('省', '市', '区')):
+                return region
+            return f'{region}省'
+        return '中国'
+    return country or '未知地区'
+
+
+def _address_key(address):
+    """将IP地址对象转换为 (版本, 定长大端字节)，IPv4映射的IPv6地址按IPv4处理"""
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.version, address.packed
+
+
+def _parse_address(value):
+    """解析点分/冒号格式或十进制整数格式的IP地址"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return ipaddress.ip_address(number) if number < 2 ** 32 else ipaddress.IPv6Address(number)
+    return ipaddress.ip_address(value)
+
+
+def parse_csv_ranges(path, country_column=None, region_column=None, encoding='utf-8'):
+    """
+    读取CSV格式的IP段数据，逐条返回 (起始地址, 结束地址, 归属地)
+    支持的格式（自动识别，首行为表头时跳过）：
+      起始IP,结束IP,...      IP可为点分/冒号格式或十进制整数（如 DB-IP、IP2Location LITE）
+      网段CIDR,...          如 1.2.3.0/24
+    country_column / region_column: 国家、省份所在列（从0开始），
+    国家列默认紧跟在IP列之后，省份列默认在国家列之后
+    """
+    with open(path, newline='', encoding=encoding) as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+                continue
+
+            try:
+                if '/' in row[0]:
+                    network = ipaddress.ip_network(row[0].strip(), strict=False)
+                    start, end = network.network_address, network.broadcast_address
+                    ip_columns = 1
+                else:
+                    start, end = _parse_address(row[0]), _parse_address(row[1])
+                    ip_columns = 2
+            except (ValueError, IndexError):
+                # 表头或无法解析的行
+                continue
+
+            country_index = ip_columns if country_column is None else country_column
+            region_index = country_index + 1 if region_column is None else region_column
+            country = row[country_index] if country_index < len(row) else ''
+            region = row[region_index] if region_index < len(row) else ''
+            yield start, end, format_location(country, region)
+
+
+def build_database(ranges, path):
+    """
+    将 (起始地址, 结束地址, 归属地) 序列编译为二进制数据库文件，返回 {版本: 记录数}
+    与前面记录重叠的IP段会被跳过；先写入临时文件再改名，替换时不影响正在读取的进程
+    """
+    locations = []
+    location_index = {}
+    records = {4: [], 6: []}
+
+    for start, end, location in ranges:
+        start_version, start_key = _address_key(start)
+        end_version, end_key = _address_key(end)
+        if start_version != end_version or start_key > end_key:
+            continue
+        if location not in location_index:
+            location_index[location] = len(locations)
+            locations.append(location)
+        records[start_version].append((start_key, end_key, location_index[location]))
+
+    counts = {}
+    for version in (4, 6):
+        merged = []
+        for record in sorted(records[version]):
+            if merged and record[0] <= merged[-1][1]:
+                continue
+            merged.append(record)
+        records[version] = merged
+        counts[version] = len(merged)
+
+    names = json.dumps(locations, ensure_ascii=False).encode('utf-8')
+    names_offset = HEADER.size + sum(
+        len(records[version]) * RECORD_FORMATS[version].size for version in (4, 6)
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(FILE_MAGIC, counts[4], counts[6], names_offset, len(names)))
+        for version in (4, 6):
+            record_format = RECORD_FORMATS[version]
+            for record in records[version]:
+                f.write(record_format.pack(*record))
+        f.write(names)
+    os.replace(temp_path, path)
+    return counts
+
+
+class _StartKeys:
+    """按下标返回记录起始地址的只读序列，供 bisect 在映射的文件上直接二分"""
+
+    def __init__(self, buffer, offset, count, record_format):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._size = record_format.size
+        self._key_size = (record_format.size - 4) // 2
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        position = self._offset + index * self._size
+        return self._buffer[position:position + self._key_size]
+
+
+class IPDatabase:
+    """只读的IP归属地数据库（mmap映射文件）"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, v4_count, v6_count, names_offset, names_length = HEADER.unpack_from(self._buffer, 0)
+        if magic != FILE_MAGIC:
+            self._buffer.close()
+            raise ValueError(f'不是有效的IP数据库文件: {path}')
+
+        self.locations = json.loads(self._buffer[names_offset:names_offset + names_length].decode('utf-8'))
+
+        v4_offset = HEADER.size
+        v6_offset = v4_offset + v4_count * RECORD_FORMATS[4].size
+        self._tables = {
+            4: (v4_offset, _StartKeys(self._buffer, v4_offset, v4_count, RECORD_FORMATS[4])),
+            6: (v6_offset, _StartKeys(self._buffer, v6_offset, v6_count, RECORD_FORMATS[6])),
+        }
+
+    @property
+    def counts(self):
+        return {version: len(keys) for version, (_, keys) in self._tables.items()}
+
+    def lookup(self, ip_address):
+        """查询IP地址的归属地，地址无效或不在任何IP段内时返回None"""
+        try:
+            version, key = _address_key(ipaddress.ip_address(ip_address.strip()))
+        except (AttributeError, ValueError):
+            return None
+
+        offset, keys = self._tables[version]
+        index = bisect_right(keys, key) - 1
+        if index < 0:
+            return None
+
+        record_format = RECORD_FORMATS[version]
+        _, end_key, location = record_format.unpack_from(self._buffer, offset + index * record_format.size)
+        if key > end_key:
+            return None
+        return self.locations[location]
+
+    def close(self):
+        self._buffer.close()
+
+
+_database = None
+_database_path = None
+_database_lock = threading.Lock()
+
+
+def get_ip_database(path):
+    """
+    获取已加载的IP数据库（每个进程只加载一次，文件不存在或无效时返回None）
+    数据库文件更新（改名替换）后需重启进程才会加载新文件
+    """
+    global _database, _database_path
+
+    if not path:
+        return None
+    if _database_path == path:
+        return _database
+
+    with _database_lock:
+        if _database_path != path:
+            database = None
+            if os.path.exists(path):
+                try:
+                    database = IPDatabase(path)
+                except (OSError, ValueError, struct.error):
+                    database = None
+            _database, _database_path = database, path
+    return _database
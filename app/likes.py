@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文章点赞计数模块
+点赞随机累加到文章的多个分片行之一，热门文章的并发点赞分散到不同的行锁上；
+读取时将文章点赞数与各分片之和相加（短时间缓存），后台任务定期把分片合并回文章的点赞数
+"""
+
+import random
+from flask import current_app
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .cache import local_cache
+from .background import PeriodicTask
+
+
+def _likes_cache_key(article_id):
+    return ('likes', article_id)
+
+
+def _pending_likes(article_id):
+    """文章各分片中尚未合并的点赞数之和"""
+    from .models import ArticleLikeShard
+
+    return db.session.query(func.coalesce(func.sum(ArticleLikeShard.count), 0))\
+        .filter(ArticleLikeShard.article_id == article_id).scalar()
+
+
+def add_like(article_id):
+    """为文章增加一次点赞（随机选择分片原子累加并提交），返回最新点赞数"""
+    from .models import ArticleLikeShard
+
+    slot = random.randrange(max(current_app.config.get('LIKE_COUNTER_SLOTS', 16), 1))
+    statement = update(ArticleLikeShard)\
+        .where(ArticleLikeShard.article_id == article_id, ArticleLikeShard.slot == slot)\
+        .values(count=ArticleLikeShard.count + 1)
+
+    if db.session.execute(statement).rowcount == 0:
+        # 分片行不存在时创建；并发创建冲突时改为累加
+        try:
+            with db.session.begin_nested():
+                db.session.add(ArticleLikeShard(article_id=article_id, slot=slot, count=1))
+        except IntegrityError:
+            db.session.execute(statement)
+
+    db.session.commit()
+    fold_task.ensure_started()
+    return get_likes_count(article_id, refresh=True)
+
+
+def get_likes_count(article_id, refresh=False):
+    """获取文章的点赞数（已合并的点赞数 + 各分片之和），结果短时间缓存"""
+    from .models import Article
+
+    key = _likes_cache_key(article_id)
+    if not refresh:
+        value = local_cache.get(key)
+        if value is not None:
+            return value
+
+    likes_count = db.session.query(Article.likes_count).filter(Article.id == article_id).scalar() or 0
+    value = likes_count + _pending_likes(article_id)
+    local_cache.set(key, value, timeout=current_app.config.get('LIKE_COUNT_CACHE_TIMEOUT', 5))
+    return value
+
+
+def reset_like_shards(article_id):
+    """清空文章的点赞分片（管理员直接修改点赞数时调用，随当前会话一起提交）"""
+    from .models import ArticleLikeShard
+
+    ArticleLikeShard.query.filter_by(article_id=article_id).delete(synchronize_session=False)
+    local_cache.delete(_likes_cache_key(article_id))
+
+
+def fold_like_shards(batch_size=500):
+    """
+    将分片中的点赞数合并到文章的点赞数，返回合并的点赞数
+    分片行加锁读取后清零，多个进程同时合并也不会重复计数
+    """
+    from .models import Article, ArticleLikeShard
+
+    folded = 0
+    while True:
+        shards = ArticleLikeShard.query.filter(ArticleLikeShard.count != 0)\
+            .order_by(ArticleLikeShard.article_id, ArticleLikeShard.slot)\
+            .limit(batch_size).with_for_update().all()
+        if not shards:
+            break
+
+        totals = {}
+        for shard in shards:
+            totals[shard.article_id] = totals.get(shard.article_id, 0) + shard.count
+            shard.count = 0
+
+        for article_id, amount in totals.items():
+            db.session.execute(
+                update(Article)
+                .where(Article.id == article_id)
+                .values(likes_count=Article.likes_count + amount)
+                .execution_options(synchronize_session=False)
+            )
+            folded += amount
+
+        db.session.commit()
+        if len(shards) < batch_size:
+            break
+
+    return folded
+
+
+# 定期合并分片的后台任务
+fold_task = PeriodicTask('like-shard-folder', fold_like_shards, 'LIKE_FOLD_INTERVAL')
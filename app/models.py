@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects.mysql import MEDIUMTEXT, VARCHAR
+from sqlalchemy.orm.attributes import set_committed_value
 from . import db
 from .utils import get_local_now
+from .cache import bump_versions, get_or_set, VERSION_CONFIG
 
 
 # 文章标签关联表
@@ -22,6 +25,8 @@ class Article(db.Model):
     title = db.Column(db.String(255), nullable=False, index=True)
     content = db.Column(db.Text)
     summary = db.Column(db.Text)
+    preview = db.Column(db.Text)  # 列表页预览（保存时由正文生成）
+    content_length = db.Column(db.Integer, default=0, nullable=False)  # 去除标签后的正文长度
     author = db.Column(db.String(100))
     
     # 状态：draft草稿, published已发布
@@ -49,6 +54,13 @@ class Article(db.Model):
     # 关联关系
     tags = db.relationship('Tag', secondary=article_tags, backref=db.backref('articles', lazy='dynamic'))
     comments = db.relationship('Comment', backref='article', lazy='dynamic', cascade='all, delete-orphan')
+    render_cache = db.relationship('ArticleRender', uselist=False, cascade='all, delete-orphan')
+    like_shards = db.relationship('ArticleLikeShard', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        # 列表排序（置顶、更新时间、ID，均降序）的复合索引：游标分页定位和文章位置统计可按索引范围扫描
+        db.Index('ix_articles_status_top_updated_id', 'status', 'is_top', 'updated_at', 'id'),
+    )
     
     def __repr__(self):
         return f'<Article {self.title}>'
@@ -60,6 +72,8 @@ class Article(db.Model):
             'title': self.title,
             'content': self.content,
             'summary': self.summary,
+            'preview': self.preview,
+            'content_length': self.content_length,
             'author': self.author,
             'status': self.status,
             'permission': self.permission,
@@ -76,6 +90,57 @@ class Article(db.Model):
         }
 
 
+class ArticleRender(db.Model):
+    """文章渲染缓存模型（Markdown转换后的HTML和目录）"""
+    __tablename__ = 'article_renders'
+    
+    article_id = db.Column(db.Integer, db.ForeignKey('articles.id'), primary_key=True)
+    content_hash = db.Column(db.String(40), nullable=False)  # 渲染时文章内容的SHA1
+    html = db.Column(db.Text().with_variant(MEDIUMTEXT(), 'mysql'))  # 渲染后的HTML
+    toc = db.Column(db.Text().with_variant(MEDIUMTEXT(), 'mysql'))  # 文章目录HTML
+    rendered_at = db.Column(db.DateTime, default=get_local_now, nullable=False)
+    
+    def __repr__(self):
+        return f'<ArticleRender {self.article_id}>'
+
+
+class ArticleLikeShard(db.Model):
+    """文章点赞分片计数模型：点赞随机累加到其中一个分片，定期合并回文章的点赞数"""
+    __tablename__ = 'article_like_shards'
+    
+    article_id = db.Column(db.Integer, db.ForeignKey('articles.id'), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 分片编号
+    count = db.Column(db.Integer, default=0, nullable=False)  # 尚未合并的点赞数
+    
+    def __repr__(self):
+        return f'<ArticleLikeShard {self.article_id}#{self.slot}={self.count}>'
+
+
+class SearchDocument(db.Model):
+    """全文搜索文档模型：记录已建立索引的文章及其加权后的文档长度"""
+    __tablename__ = 'search_documents'
+    
+    article_id = db.Column(db.Integer, db.ForeignKey('articles.id'), primary_key=True)
+    length = db.Column(db.Integer, default=0, nullable=False)  # 按字段权重累加的索引词数
+    
+    def __repr__(self):
+        return f'<SearchDocument {self.article_id} len={self.length}>'
+
+
+class SearchPosting(db.Model):
+    """全文搜索倒排索引模型：索引词在文章中按字段权重累加的词频"""
+    __tablename__ = 'search_postings'
+    
+    # MySQL 默认排序规则不区分重音等差异，索引词需按二进制比较，避免不同词主键冲突
+    term = db.Column(db.String(32).with_variant(VARCHAR(32, collation='utf8mb4_bin'), 'mysql'),
+                     primary_key=True)
+    article_id = db.Column(db.Integer, db.ForeignKey('articles.id'), primary_key=True, index=True)
+    frequency = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<SearchPosting {self.term}@{self.article_id}={self.frequency}>'
+
+
 class Tag(db.Model):
     """标签模型"""
     __tablename__ = 'tags'
@@ -141,11 +206,26 @@ class Config(db.Model):
     def __repr__(self):
         return f'<Config {self.key_name}>'
     
+    @staticmethod
+    def get_all():
+        """
+        获取全部配置项 {键: 值}（只读，不要修改返回的字典）
+        整表加载为进程内快照，配置版本号变化后重新加载，其他进程在版本号检查间隔内感知修改
+        """
+        from flask import current_app
+        
+        return get_or_set(
+            ('site_config',),
+            lambda: dict(db.session.query(Config.key_name, Config.value).all()),
+            depends=(VERSION_CONFIG,),
+            timeout=current_app.config.get('CONFIG_CACHE_TIMEOUT', 3600)
+        )
+    
     @staticmethod
     def get_value(key, default=None):
-        """获取配置值"""
-        config = Config.query.get(key)
-        return config.value if config else default
+        """获取配置值（读取进程内快照）"""
+        config = Config.get_all()
+        return config[key] if key in config else default
     
     @staticmethod
     def set_value(key, value):
@@ -157,9 +237,43 @@ class Config(db.Model):
         else:
             config = Config(key_name=key, value=value)
             db.session.add(config)
+        bump_versions(VERSION_CONFIG)
         db.session.commit()
         return config
     
+    @staticmethod
+    def set_many(values):
+        """
+        批量设置配置值 {键: 值}：一条语句写入（已存在的键更新，不存在的插入），
+        配置版本号只递增一次并在同一事务中提交，读取方不会看到只更新了一部分的配置
+        """
+        if not values:
+            return
+        
+        now = get_local_now()
+        rows = [{'key_name': key, 'value': value, 'updated_at': now} for key, value in values.items()]
+        
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(Config).values(rows)
+            stmt = stmt.on_duplicate_key_update(value=stmt.inserted.value, updated_at=stmt.inserted.updated_at)
+            db.session.execute(stmt)
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(Config).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Config.key_name],
+                set_={'value': stmt.excluded.value, 'updated_at': stmt.excluded.updated_at}
+            )
+            db.session.execute(stmt)
+        else:
+            for row in rows:
+                db.session.merge(Config(**row))
+        
+        bump_versions(VERSION_CONFIG)
+        db.session.commit()
+    
     def to_dict(self):
         """转换为字典"""
         return {
@@ -169,6 +283,30 @@ class Config(db.Model):
         }
 
 
+class CacheVersion(db.Model):
+    """缓存版本号模型，用于跨进程失效本地缓存"""
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.BigInteger, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=get_local_now, nullable=False)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+
+class SiteCounter(db.Model):
+    """站点计数器模型，维护需要频繁读取的汇总值（如已发布文章总浏览量）"""
+    __tablename__ = 'site_counters'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.BigInteger, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=get_local_now, nullable=False)
+    
+    def __repr__(self):
+        return f'<SiteCounter {self.name}={self.value}>'
+
+
 class SiteVisit(db.Model):
     """网站访问统计模型"""
     __tablename__ = 'site_visits'
@@ -198,41 +336,73 @@ class SiteVisit(db.Model):
     
     @staticmethod
     def get_stats():
-        """获取访问统计信息"""
-        from sqlalchemy import func, distinct
-        
-        # 总访问次数
-        total_visits = SiteVisit.query.count()
-        
-        # 独立访客数（按IP去重）
-        unique_visitors = db.session.query(func.count(distinct(SiteVisit.ip_address))).scalar()
-        
-        # 今日访问次数
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_visits = SiteVisit.query.filter(SiteVisit.visit_time >= today_start).count()
-        
-        # 今日独立访客
-        today_unique = db.session.query(func.count(distinct(SiteVisit.ip_address))).filter(
-            SiteVisit.visit_time >= today_start
-        ).scalar()
-        
-        # 最近7天访问次数
-        week_ago = datetime.now() - timedelta(days=7)
-        week_visits = SiteVisit.query.filter(SiteVisit.visit_time >= week_ago).count()
-        
-        # 最近7天独立访客
-        week_unique = db.session.query(func.count(distinct(SiteVisit.ip_address))).filter(
-            SiteVisit.visit_time >= week_ago
-        ).scalar()
-        
-        return {
-            'total_visits': total_visits or 0,
-            'unique_visitors': unique_visitors or 0,
-            'today_visits': today_visits or 0,
-            'today_unique': today_unique or 0,
-            'week_visits': week_visits or 0,
-            'week_unique': week_unique or 0
-        }
+        """获取访问统计信息（读取按天汇总的统计表）"""
+        from .visit_stats import get_site_stats
+        return get_site_stats()
+
+
+class VisitDailyStat(db.Model):
+    """访问统计日汇总模型"""
+    __tablename__ = 'visit_daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    visits = db.Column(db.Integer, default=0, nullable=False)  # 访问次数
+    unique_ips = db.Column(db.Integer, default=0, nullable=False)  # 独立访客数（按IP去重）
+    ip_sketch = db.Column(db.LargeBinary)  # 当天访客IP的HyperLogLog概要，用于合并估算多天的独立访客
+    updated_at = db.Column(db.DateTime, default=get_local_now, nullable=False)
+    
+    def __repr__(self):
+        return f'<VisitDailyStat {self.day} {self.visits}>'
+
+
+class VisitHourlyStat(db.Model):
+    """访问统计小时汇总模型"""
+    __tablename__ = 'visit_hourly_stats'
+    
+    hour = db.Column(db.DateTime, primary_key=True)  # 整点时间
+    visits = db.Column(db.Integer, default=0, nullable=False)
+    unique_ips = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<VisitHourlyStat {self.hour} {self.visits}>'
+
+
+class VisitDailyIp(db.Model):
+    """每日访客IP汇总模型，用于跨天的独立访客去重"""
+    __tablename__ = 'visit_daily_ips'
+    
+    day = db.Column(db.Date, primary_key=True)
+    ip_address = db.Column(db.String(45), primary_key=True)
+    visits = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<VisitDailyIp {self.day} {self.ip_address}>'
+
+
+class VisitPageDailyStat(db.Model):
+    """页面访问日汇总模型"""
+    __tablename__ = 'visit_page_daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    page_url = db.Column(db.String(255), primary_key=True)
+    visits = db.Column(db.Integer, default=0, nullable=False)
+    unique_ips = db.Column(db.Integer, default=0, nullable=False)
+    ip_sketch = db.Column(db.LargeBinary)  # 当天该页面访客IP的HyperLogLog概要
+    
+    def __repr__(self):
+        return f'<VisitPageDailyStat {self.day} {self.page_url}>'
+
+
+class VisitRefererDailyStat(db.Model):
+    """来源页面日汇总模型"""
+    __tablename__ = 'visit_referer_daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    referer = db.Column(db.String(255), primary_key=True)
+    visits = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<VisitRefererDailyStat {self.day} {self.referer}>'
 
 
 class Comment(db.Model):
@@ -255,47 +425,178 @@ class Comment(db.Model):
     article_id = db.Column(db.Integer, db.ForeignKey('articles.id'), nullable=False, index=True)
     parent_id = db.Column(db.Integer, db.ForeignKey('comments.id'), index=True)  # 父评论ID，支持回复
     
+    # 物化路径：从顶层评论到本评论的定长ID序列（如 0000000001/0000000005/），插入时生成；
+    # 同一线程的评论路径前缀相同，按路径排序即为线程顺序，整个线程可用一次索引范围扫描取出
+    thread_path = db.Column(db.String(255))
+    
     # 自引用关系，支持评论层级结构
     replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
     
+    __table_args__ = (
+        db.Index('ix_comments_article_thread_path', 'article_id', 'thread_path'),
+    )
+    
+    # 路径中每级ID的位数，以及路径的最大长度
+    THREAD_PATH_DIGITS = 10
+    THREAD_PATH_MAX_LENGTH = 255
+    
     def __repr__(self):
         return f'<Comment {self.id} on Article {self.article_id}>'
     
-    @property
-    def display_name(self):
+    @staticmethod
+    def build_thread_path(parent_path, comment_id):
+        """
+        根据父评论路径生成评论的路径（父路径为空表示顶层评论）；
+        超过最大长度（约23级）时作为父评论的同级，避免路径被截断
+        """
+        parent_path = parent_path or ''
+        segment = f'{comment_id:0{Comment.THREAD_PATH_DIGITS}d}/'
+        if len(parent_path) + len(segment) > Comment.THREAD_PATH_MAX_LENGTH:
+            parent_path = parent_path[:-len(segment)]
+        return parent_path + segment
+    
+    @staticmethod
+    def thread_range(paths):
+        """覆盖一组线程（路径前缀）全部评论的路径范围 [下界, 上界)"""
+        return min(paths), max(paths) + '~'
+    
+    @staticmethod
+    def rebuild_thread_paths(batch_size=500):
+        """根据 parent_id 重新生成全部评论的物化路径（分批提交），返回处理的评论数"""
+        parents = dict(db.session.query(Comment.id, Comment.parent_id).order_by(Comment.id).all())
+        
+        paths = {}
+        
+        def path_of(comment_id):
+            # 按祖先链自上而下生成，父评论不存在（已删除）时视为顶层评论
+            chain = []
+            current = comment_id
+            while current is not None and current not in paths and current not in chain:
+                chain.append(current)
+                current = parents.get(current)
+            parent_path = paths.get(current, '')
+            for item in reversed(chain):
+                parent_path = paths[item] = Comment.build_thread_path(parent_path, item)
+            return paths[comment_id]
+        
+        comment_ids = list(parents)
+        for start in range(0, len(comment_ids), batch_size):
+            db.session.execute(update(Comment), [
+                {'id': comment_id, 'thread_path': path_of(comment_id)}
+                for comment_id in comment_ids[start:start + batch_size]
+            ])
+            db.session.commit()
+        return len(comment_ids)
+    
+    @staticmethod
+    def format_display_name(comment_id, nickname):
         """显示名称：如果有昵称显示昵称，否则显示匿名访客"""
-        if self.nickname and self.nickname.strip():
-            return self.nickname
+        if nickname and nickname.strip():
+            return nickname
         else:
             # 匿名化IP显示，只显示前缀，不暴露真实IP
-            return f"访客_{self.id:04d}"
+            return f"访客_{comment_id:04d}"
+    
+    @staticmethod
+    def format_location_display(location):
+        """显示地理位置信息"""
+        if location and location != '未知地区':
+            return f"来自 {location}"
+        return ""
+    
+    @property
+    def display_name(self):
+        """显示名称：如果有昵称显示昵称，否则显示匿名访客"""
+        return Comment.format_display_name(self.id, self.nickname)
     
     @property
     def location_display(self):
         """显示地理位置信息"""
-        if self.location and self.location != '未知地区':
-            return f"来自 {self.location}"
-        return ""
+        return Comment.format_location_display(self.location)
     
-    def to_dict(self):
-        """转换为字典"""
+    @staticmethod
+    def _serialize(row, replies_count):
+        """按列值生成字典（ORM对象和查询行元组通用）"""
         return {
-            'id': self.id,
-            'content': self.content,
-            'nickname': self.nickname,
-            'display_name': self.display_name,
-            'ip_address': self.ip_address,
-            'location': self.location,
-            'location_display': self.location_display,
-            'is_private': self.is_private,
-            'status': self.status,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'article_id': self.article_id,
-            'parent_id': self.parent_id,
-            'replies_count': self.replies.count()
+            'id': row.id,
+            'content': row.content,
+            'nickname': row.nickname,
+            'display_name': Comment.format_display_name(row.id, row.nickname),
+            'ip_address': row.ip_address,
+            'location': row.location,
+            'location_display': Comment.format_location_display(row.location),
+            'is_private': row.is_private,
+            'status': row.status,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'article_id': row.article_id,
+            'parent_id': row.parent_id,
+            'replies_count': replies_count
         }
+    
+    def to_dict(self):
+        """转换为字典"""
+        return Comment._serialize(self, self.replies.count())
+    
+    @staticmethod
+    def row_query():
+        """只查询序列化所需列的查询（返回行元组，不构造ORM对象），配合 bulk_to_dicts 使用"""
+        return db.session.query(
+            Comment.id, Comment.content, Comment.nickname, Comment.ip_address, Comment.location,
+            Comment.is_private, Comment.status, Comment.created_at, Comment.article_id, Comment.parent_id,
+            Comment.thread_path
+        )
+    
+    @staticmethod
+    def reply_counts(comment_ids):
+        """一次分组查询多条评论的回复数 {评论ID: 回复数}（与 to_dict 相同，统计全部状态的回复）"""
+        if not comment_ids:
+            return {}
+        return dict(
+            db.session.query(Comment.parent_id, db.func.count(Comment.id))
+            .filter(Comment.parent_id.in_(comment_ids))
+            .group_by(Comment.parent_id)
+            .all()
+        )
+    
+    @staticmethod
+    def approved_counts(article_id):
+        """一次分组查询文章已通过审核的 (顶层评论数, 回复数)"""
+        is_root = Comment.parent_id.is_(None)
+        rows = db.session.query(is_root, db.func.count(Comment.id)).filter(
+            Comment.article_id == article_id,
+            Comment.status == 'approved'
+        ).group_by(is_root).all()
+        
+        counts = {bool(root): count for root, count in rows}
+        return counts.get(True, 0), counts.get(False, 0)
+    
+    @staticmethod
+    def bulk_to_dicts(rows):
+        """批量转换为字典（结果与 to_dict 相同），全部评论的回复数只查询一次"""
+        counts = Comment.reply_counts([row.id for row in rows])
+        return [Comment._serialize(row, counts.get(row.id, 0)) for row in rows]
+
 
 
+@event.listens_for(Comment, 'after_insert')
+def _assign_comment_thread_path(mapper, connection, target):
+    """
+    评论插入后（已取得ID）根据父评论的路径生成物化路径，在同一事务中写入；
+    父评论还没有路径时（旧数据未回填）同样留空，由 rebuild_thread_paths 统一生成
+    """
+    comments = Comment.__table__
+    parent_path = ''
+    if target.parent_id:
+        parent_path = connection.execute(
+            select(comments.c.thread_path).where(comments.c.id == target.parent_id)
+        ).scalar()
+        if not parent_path:
+            return
+    
+    thread_path = Comment.build_thread_path(parent_path, target.id)
+    connection.execute(update(comments).where(comments.c.id == target.id).values(thread_path=thread_path))
+    set_committed_value(target, 'thread_path', thread_path)
+
 class Music(db.Model):
     """音乐模型"""
     __tablename__ = 'music'
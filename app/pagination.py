@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分页工具模块
+提供基于游标（keyset/seek）的分页：按排序键定位上一页/下一页，
+避免深分页时 OFFSET 扫描和每页一次的 COUNT(*)
+"""
+
+import json
+import base64
+import binascii
+from datetime import datetime
+from sqlalchemy import and_, or_, literal
+
+
+def encode_cursor(values):
+    """将排序键编码为URL安全的不透明游标"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_value(value, expected_type):
+    """将游标中的值还原为排序列的类型，类型不符时抛出ValueError"""
+    if expected_type is datetime:
+        if not isinstance(value, str):
+            raise ValueError(value)
+        return datetime.fromisoformat(value)
+    # bool是int的子类，需单独区分
+    if isinstance(value, bool) != (expected_type is bool) or not isinstance(value, expected_type):
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(cursor, columns):
+    """解析游标，格式不正确或值的类型与排序列不符时返回None"""
+    if not cursor:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        return None
+
+    try:
+        return [_decode_value(value, column.type.python_type) for column, value in zip(columns, payload)]
+    except ValueError:
+        return None
+
+
+def _seek_condition(columns, values, forward):
+    """
+    构造定位条件：所有排序列均为降序时，forward=True 表示排在游标之后的行，
+    forward=False 表示排在游标之前的行
+    """
+    # 使用绑定参数比较，布尔列（如置顶标记）也能参与大小比较
+    bounds = [literal(value, column.type) for column, value in zip(columns, values)]
+
+    conditions = []
+    for index, column in enumerate(columns):
+        equal_prefix = [columns[i] == bounds[i] for i in range(index)]
+        compare = column < bounds[index] if forward else column > bounds[index]
+        conditions.append(and_(*equal_prefix, compare))
+    return or_(*conditions)
+
+
+def count_ahead(query, columns, values):
+    """统计按排序列（均为降序）排在给定排序键之前的行数，即该行的位置（从0开始）"""
+    return query.filter(_seek_condition(columns, values, forward=False)).order_by(None).count()
+
+
+class KeysetPagination:
+    """
+    游标分页结果，接口与Flask-SQLAlchemy的分页对象保持相近（items、has_prev、has_next、total），
+    另提供 prev_cursor / next_cursor 用于构建翻页链接
+    columns: 排序列（均按降序），最后一列必须唯一（如主键）以保证顺序稳定
+    """
+
+    def __init__(self, query, columns, per_page=10, after=None, before=None, total=None):
+        self.per_page = per_page
+        self._columns = columns
+        self._total = total
+
+        after_values = decode_cursor(after, columns)
+        before_values = decode_cursor(before, columns) if after_values is None else None
+
+        if before_values is not None:
+            # 向前翻页：反向排序取游标之前的行，再恢复为正常顺序
+            rows = query.filter(_seek_condition(columns, before_values, forward=False))\
+                .order_by(*[column.asc() for column in columns])\
+                .limit(per_page + 1).all()
+            self.has_prev = len(rows) > per_page
+            self.has_next = True
+            self.items = list(reversed(rows[:per_page]))
+        else:
+            if after_values is not None:
+                query = query.filter(_seek_condition(columns, after_values, forward=True))
+            rows = query.order_by(*[column.desc() for column in columns])\
+                .limit(per_page + 1).all()
+            self.has_next = len(rows) > per_page
+            self.has_prev = after_values is not None
+            self.items = rows[:per_page]
+
+        self.next_cursor = self._cursor_for(self.items[-1]) if self.has_next and self.items else None
+        self.prev_cursor = self._cursor_for(self.items[0]) if self.has_prev and self.items else None
+
+    def _cursor_for(self, item):
+        return encode_cursor([getattr(item, column.key) for column in self._columns])
+
+    @property
+    def total(self):
+        """总条数（按需计算，可传入缓存的数值或可调用对象）"""
+        if callable(self._total):
+            self._total = self._total()
+        return self._total
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class ListPagination:
+    """
+    对已排好序的列表分页（如按相关度排序的搜索结果），接口与Flask-SQLAlchemy的分页对象一致
+    items 为当前页的元素，可在分页后替换为对应的对象
+    """
+
+    def __init__(self, sequence, page=1, per_page=10):
+        self.total = len(sequence)
+        self.per_page = per_page
+        self.pages = max(0, (self.total + per_page - 1) // per_page)
+        self.page = max(1, page)
+        start = (self.page - 1) * per_page
+        self.items = list(sequence[start:start + per_page])
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        """与Flask-SQLAlchemy相同的页码序列，省略的部分用None表示"""
+        last = 0
+        for num in range(1, self.pages + 1):
+            if (num <= left_edge
+                    or self.page - left_current <= num < self.page + right_current + 1
+                    or num > self.pages - right_edge):
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+    def __iter__(self):
+        return iter(self.items)
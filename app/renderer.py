@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文章渲染模块
+负责Markdown转换、文章渲染结果（HTML和目录）的持久化缓存，以及列表页预览内容的生成
+"""
+
+import re
+import hashlib
+import threading
+import markdown
+from . import db
+from .utils import get_local_now
+
+
+# Markdown扩展配置（文章详情页与markdown过滤器共用）
+MARKDOWN_EXTENSIONS = [
+    'markdown.extensions.fenced_code',  # 代码块支持
+    'markdown.extensions.tables',       # 表格支持
+    'markdown.extensions.toc',          # 目录支持
+    'markdown.extensions.nl2br',        # 换行支持
+]
+
+MARKDOWN_EXTENSION_CONFIGS = {
+    'markdown.extensions.toc': {
+        'title': '文章目录',
+        'anchorlink': False,
+        'permalink': False
+    }
+}
+
+
+# 预览内容处理用到的正则
+HTML_IMG_PATTERN = re.compile(r'<img[^>]*>')
+MARKDOWN_IMG_PATTERN = re.compile(r'!\[[^\]]*\]\([^\)]*\)')
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# 列表页预览显示的行数
+PREVIEW_LINES = 2
+
+
+# 每个线程持有一个预先配置好的Markdown实例，避免每次渲染重复加载扩展、编译正则
+_thread_local = threading.local()
+
+
+def create_markdown():
+    """创建一个按站点配置初始化的Markdown实例"""
+    return markdown.Markdown(
+        extensions=MARKDOWN_EXTENSIONS,
+        extension_configs=MARKDOWN_EXTENSION_CONFIGS
+    )
+
+
+def get_markdown():
+    """获取当前线程复用的Markdown实例"""
+    md = getattr(_thread_local, 'markdown', None)
+    if md is None:
+        md = create_markdown()
+        _thread_local.markdown = md
+    return md
+
+
+def render_markdown(text):
+    """将Markdown文本转换为HTML，返回 (html, toc)"""
+    if not text:
+        return '', ''
+
+    md = get_markdown()
+    # 复用实例前必须重置，清除上一次转换留下的状态（目录、脚注等）
+    md.reset()
+    html = md.convert(text)
+    return html, md.toc
+
+
+def compute_content_hash(text):
+    """计算文章内容的哈希值，用于判断渲染缓存是否过期"""
+    return hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+
+
+def refresh_article_render(article):
+    """重新渲染文章并更新渲染缓存（随文章所在的会话一起提交）"""
+    from .models import ArticleRender
+
+    html, toc = render_markdown(article.content)
+
+    render_cache = article.render_cache
+    if render_cache is None:
+        render_cache = ArticleRender()
+        article.render_cache = render_cache
+
+    render_cache.content_hash = compute_content_hash(article.content)
+    render_cache.html = html
+    render_cache.toc = toc
+    render_cache.rendered_at = get_local_now()
+    return render_cache
+
+
+def get_article_render(article):
+    """获取文章的渲染结果 (html, toc)，缓存缺失或过期时重新渲染并保存"""
+    render_cache = article.render_cache
+    if render_cache is not None and render_cache.content_hash == compute_content_hash(article.content):
+        return render_cache.html, render_cache.toc
+
+    try:
+        render_cache = refresh_article_render(article)
+        db.session.commit()
+        return render_cache.html, render_cache.toc
+    except Exception:
+        # 缓存写入失败不影响文章展示，直接返回实时渲染结果
+        db.session.rollback()
+        return render_markdown(article.content)
+
+
+def strip_content(text):
+    """去除内容中的HTML标签，图片替换为[图片]"""
+    if not text:
+        return ''
+
+    # 先处理HTML img标签，替换为[图片]
+    text = HTML_IMG_PATTERN.sub('[图片]', text)
+
+    # 处理markdown图片语法，替换为[图片]
+    text = MARKDOWN_IMG_PATTERN.sub('[图片]', text)
+
+    # 移除其他HTML标签
+    return HTML_TAG_PATTERN.sub('', text)
+
+
+def build_preview(stripped_text, lines=PREVIEW_LINES):
+    """从已清理的文本中截取前几行非空内容作为预览"""
+    preview_lines = []
+
+    count = 0
+    for line in stripped_text.split('\n'):
+        if line.strip():  # 只计算非空行
+            preview_lines.append(line.strip())
+            count += 1
+            if count >= lines:
+                break
+
+    return '\n'.join(preview_lines) + ('...' if count >= lines else '')
+
+
+def refresh_article_preview(article):
+    """重新计算文章的列表预览和纯文本长度（随文章所在的会话一起提交）"""
+    stripped_text = strip_content(article.content)
+    article.preview = build_preview(stripped_text) if stripped_text else ''
+    article.content_length = len(stripped_text.strip())
+    return article.preview
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+全文搜索模块
+对文章标题、摘要和正文（需验证的文章不含正文）建立倒排索引：中日韩文字按单字和相邻两字（bigram）切分，
+其他文字按单词切分；查询时按 BM25 计算相关度排序。文章保存/删除时更新索引
+"""
+
+import re
+import math
+from collections import Counter
+from functools import lru_cache
+from markupsafe import Markup, escape
+from sqlalchemy import func, insert, or_
+from . import db
+from .cache import bump_versions, VERSION_ARTICLES
+from .renderer import strip_content
+
+
+# 各字段的权重（词频和文档长度都按权重累加）
+FIELD_WEIGHTS = (('title', 3), ('summary', 2), ('content', 1))
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 索引词的最大长度（与数据库字段长度一致）
+MAX_TERM_LENGTH = 32
+
+# 单词检索词按前缀匹配索引词（如 pyth 匹配 python）的最小长度，以及前缀匹配的词频权重
+MIN_PREFIX_LENGTH = 2
+PREFIX_MATCH_WEIGHT = 0.5
+
+# 搜索结果摘要片段的默认长度（字符数）
+SNIPPET_LENGTH = 120
+
+# 中日韩文字（汉字、假名、谚文）连续片段，以及其他语言的单词
+CJK_RANGES = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+TOKEN_PATTERN = re.compile(rf'([{CJK_RANGES}]+)|([^\W_{CJK_RANGES}]+)')
+CJK_PATTERN = re.compile(rf'[{CJK_RANGES}]')
+
+
+def tokenize(text):
+    """将文本切分为索引词：中日韩文字输出单字和bigram，其他文字输出小写单词"""
+    tokens = []
+    if not text:
+        return tokens
+
+    for cjk_run, word in TOKEN_PATTERN.findall(text.lower()):
+        if cjk_run:
+            tokens.extend(cjk_run)
+            tokens.extend(cjk_run[i:i + 2] for i in range(len(cjk_run) - 1))
+        else:
+            tokens.append(word[:MAX_TERM_LENGTH])
+    return tokens
+
+
+def tokenize_query(query):
+    """
+    将查询切分为检索词：中日韩文字片段按bigram匹配（单个字时按单字），其他文字按单词；
+    返回去重后的检索词列表
+    """
+    terms = []
+    for cjk_run, word in TOKEN_PATTERN.findall((query or '').lower()):
+        if cjk_run:
+            if len(cjk_run) == 1:
+                terms.append(cjk_run)
+            else:
+                terms.extend(cjk_run[i:i + 2] for i in range(len(cjk_run) - 1))
+        else:
+            terms.append(word[:MAX_TERM_LENGTH])
+    return list(dict.fromkeys(terms))
+
+
+def _weighted_terms(article):
+    """
+    计算文章各索引词按字段加权后的词频，以及加权后的文档长度
+    需要验证的文章只索引标题和摘要，正文不进入索引，避免未验证的访客通过正文中的词搜到文章
+    """
+    frequencies = Counter()
+    length = 0
+    for field, weight in FIELD_WEIGHTS:
+        if field == 'content' and article.permission == 'verify':
+            continue
+        value = getattr(article, field)
+        if field == 'content':
+            value = strip_content(value)
+        tokens = tokenize(value)
+        length += weight * len(tokens)
+        for token, count in Counter(tokens).items():
+            frequencies[token] += weight * count
+    return frequencies, length
+
+
+def remove_article_index(article_id):
+    """删除文章的索引（随当前会话一起提交）"""
+    from .models import SearchPosting, SearchDocument
+
+    SearchPosting.query.filter_by(article_id=article_id).delete(synchronize_session=False)
+    SearchDocument.query.filter_by(article_id=article_id).delete(synchronize_session=False)
+
+
+def index_article(article):
+    """重建文章的索引（随当前会话一起提交，新文章需先flush取得id）"""
+    from .models import SearchPosting, SearchDocument
+
+    if article.id is None:
+        db.session.flush()
+
+    remove_article_index(article.id)
+
+    frequencies, length = _weighted_terms(article)
+    db.session.add(SearchDocument(article_id=article.id, length=length))
+    if frequencies:
+        db.session.execute(insert(SearchPosting), [
+            {'term': term, 'article_id': article.id, 'frequency': frequency}
+            for term, frequency in frequencies.items()
+        ])
+
+
+def rebuild_search_index(batch_size=100):
+    """重建全部文章的索引（分批提交），返回处理的文章数"""
+    from .models import Article, SearchPosting, SearchDocument
+
+    SearchPosting.query.delete(synchronize_session=False)
+    SearchDocument.query.delete(synchronize_session=False)
+    db.session.commit()
+
+    indexed_count = 0
+    last_id = 0
+    while True:
+        articles = Article.query.filter(Article.id > last_id).order_by(Article.id).limit(batch_size).all()
+        if not articles:
+            break
+
+        for article in articles:
+            index_article(article)
+            indexed_count += 1
+
+        last_id = articles[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+
+    # 使已缓存的搜索结果失效
+    bump_versions(VERSION_ARTICLES)
+    db.session.commit()
+    return indexed_count
+
+
+def _collection_stats():
+    """索引中的文档数和平均文档长度"""
+    from .models import SearchDocument
+
+    count, average_length = db.session.query(
+        func.count(SearchDocument.article_id), func.avg(SearchDocument.length)
+    ).one()
+    return count or 0, float(average_length or 0)
+
+
+def rank_articles(query, candidate_query=None):
+    """
+    按相关度返回匹配查询的文章ID列表（从高到低）
+    单词检索词也匹配以其开头的索引词（完整单词的权重更高）；
+    优先返回包含全部检索词的文章，没有时退回为包含任一检索词；
+    candidate_query: 可选的文章查询（如带筛选条件的已发布文章），只返回其中的文章
+    """
+    from .models import Article, SearchPosting, SearchDocument
+
+    terms = tokenize_query(query)
+    if not terms:
+        return []
+
+    document_count, average_length = _collection_stats()
+    if not document_count:
+        return []
+
+    # 单词检索词同时按前缀匹配（输入部分单词也能找到文章），中日韩文字已按单字/bigram索引
+    prefixes = [term for term in terms if len(term) >= MIN_PREFIX_LENGTH and not CJK_PATTERN.search(term)]
+    conditions = [SearchPosting.term.in_(terms)]
+    conditions.extend(SearchPosting.term.startswith(prefix, autoescape=True) for prefix in prefixes)
+
+    postings = db.session.query(
+        SearchPosting.term, SearchPosting.article_id, SearchPosting.frequency, SearchDocument.length
+    ).join(SearchDocument, SearchDocument.article_id == SearchPosting.article_id)\
+        .filter(or_(*conditions)).all()
+    if not postings:
+        return []
+
+    # 按检索词汇总每篇文章的词频（前缀匹配的索引词按较低权重计入）
+    frequencies = {}
+    lengths = {}
+    for term, article_id, frequency, length in postings:
+        lengths[article_id] = length
+        for query_term in terms:
+            if term == query_term:
+                weight = 1
+            elif query_term in prefixes and term.startswith(query_term):
+                weight = PREFIX_MATCH_WEIGHT
+            else:
+                continue
+            key = (query_term, article_id)
+            frequencies[key] = frequencies.get(key, 0) + frequency * weight
+
+    document_frequency = Counter(query_term for query_term, _ in frequencies)
+    scores = Counter()
+    matched_terms = Counter()
+    for (query_term, article_id), frequency in frequencies.items():
+        df = document_frequency[query_term]
+        idf = math.log(1 + (document_count - df + 0.5) / (df + 0.5))
+        length = lengths[article_id]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length) if average_length else BM25_K1
+        scores[article_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        matched_terms[article_id] += 1
+
+    candidates = [article_id for article_id, count in matched_terms.items() if count == len(terms)]
+    if not candidates:
+        candidates = list(scores)
+
+    if candidate_query is not None:
+        allowed = set()
+        for start in range(0, len(candidates), 500):
+            allowed.update(article_id for article_id, in candidate_query.filter(
+                Article.id.in_(candidates[start:start + 500])
+            ).with_entities(Article.id))
+        candidates = [article_id for article_id in candidates if article_id in allowed]
+
+    # 相关度相同时新文章在前
+    return sorted(candidates, key=lambda article_id: (-scores[article_id], -article_id))
+
+
+@lru_cache(maxsize=256)
+def highlight_pattern(query):
+    """
+    将查询按空白拆分为关键词，编译为一个忽略大小写的正则（长词在前，优先整体匹配），
+    按查询字符串缓存；没有关键词时返回None
+    """
+    terms = sorted(set((query or '').split()), key=len, reverse=True)
+    if not terms:
+        return None
+    return re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+
+
+def highlight(text, query):
+    """一次扫描高亮文本中的全部关键词，保留原文大小写，其余内容按HTML转义"""
+    pattern = highlight_pattern(query)
+    if not text or pattern is None:
+        return escape(text or '')
+
+    parts = []
+    last_end = 0
+    for match in pattern.finditer(text):
+        parts.append(escape(text[last_end:match.start()]))
+        parts.append(Markup('<mark class="search-highlight">%s</mark>') % match.group())
+        last_end = match.end()
+    parts.append(escape(text[last_end:]))
+    return Markup('').join(parts)
+
+
+def extract_snippet(text, query, length=SNIPPET_LENGTH):
+    """
+    从纯文本中截取包含最多不同关键词（其次是匹配次数最多）的片段并高亮，
+    片段不在开头或结尾时加省略号；没有匹配时返回None
+    """
+    pattern = highlight_pattern(query)
+    if not text or pattern is None:
+        return None
+
+    matches = [(match.start(), match.end(), match.group().lower()) for match in pattern.finditer(text)]
+    if not matches:
+        return None
+
+    # 以每个匹配为窗口起点，双指针统计窗口内的匹配
+    best = None
+    end_index = 0
+    for start_index, (window_start, _, _) in enumerate(matches):
+        end_index = max(end_index, start_index)
+        while end_index + 1 < len(matches) and matches[end_index + 1][1] <= window_start + length:
+            end_index += 1
+        window = matches[start_index:end_index + 1]
+        score = (len({term for _, _, term in window}), len(window))
+        if best is None or score > best[0]:
+            best = (score, window_start, window[-1][1])
+
+    _, first_start, last_end = best
+    # 关键词前后各留一些上下文
+    padding = max(0, length - (last_end - first_start)) // 2
+    start = max(0, first_start - padding)
+    end = min(len(text), max(last_end, start + length))
+    start = max(0, min(start, end - length))
+
+    snippet = highlight(text[start:end], query)
+    if start > 0:
+        snippet = Markup('…') + snippet
+    if end < len(text):
+        snippet = snippet + Markup('…')
+    return snippet
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+搜索建议模块
+在进程内维护已发布文章标题和标签名的前缀索引（排序数组 + 二分查找），
+用于搜索框的实时建议，输入时不访问数据库。
+文章和标签分别建立索引，各自的缓存版本号变化后读取当前的 (ID, 名称) 列表与已索引的内容比较，
+只删除、插入有变化的条目（其他进程的修改只能通过版本号得知，因此仍需读取一次名称列表）
+"""
+
+import threading
+from bisect import bisect_left
+from .cache import versions, VERSION_ARTICLES, VERSION_TAGS
+from .search import TOKEN_PATTERN
+
+
+# 返回的建议条数上限
+SUGGESTION_LIMIT = 8
+
+# 匹配键（名称从匹配起点开始的后缀）保存的最大长度，避免长标题的后缀总长度按平方增长
+MAX_KEY_LENGTH = 32
+
+# 变化的条目超过已索引条目的这一比例时整体重建
+REBUILD_RATIO = 0.25
+
+
+def _match_starts(text):
+    """可作为匹配起点的位置：每个单词的开头和每个中日韩文字"""
+    starts = []
+    for match in TOKEN_PATTERN.finditer(text):
+        if match.group(1):
+            starts.extend(range(match.start(), match.end()))
+        else:
+            starts.append(match.start())
+    return starts
+
+
+def _build_entries(items):
+    """
+    将 (类型, ID, 名称) 列表转换为排序后的索引条目 (匹配键, 顺序, 类型, ID, 名称)
+    名称从每个匹配起点开始的后缀（最多 MAX_KEY_LENGTH 个字符）都作为匹配键，便于从标题中间的词开始匹配；
+    顺序为0表示从名称开头匹配，排在其他匹配之前
+    """
+    entries = []
+    for kind, item_id, name in items:
+        lowered = name.lower()
+        for start in _match_starts(lowered):
+            entries.append((lowered[start:start + MAX_KEY_LENGTH], 0 if start == 0 else 1, kind, item_id, name))
+    entries.sort()
+    return entries
+
+
+class _PrefixPart:
+    """前缀索引的一部分（文章标题或标签名），依赖的版本号变化后按差异更新"""
+
+    def __init__(self, version_name, loader):
+        self.version_name = version_name
+        self.loader = loader
+        self.names = {}
+        self.entries = []
+        self.keys = []
+        self.built_version = None
+
+    def refresh(self, version):
+        if version == self.built_version:
+            return
+
+        names = {(kind, item_id): name for kind, item_id, name in self.loader()}
+        removed = [(kind, item_id, name) for (kind, item_id), name in self.names.items()
+                   if names.get((kind, item_id)) != name]
+        added = [(kind, item_id, name) for (kind, item_id), name in names.items()
+                 if self.names.get((kind, item_id)) != name]
+
+        if self.built_version is None or len(removed) + len(added) > len(self.names) * REBUILD_RATIO:
+            entries = _build_entries((kind, item_id, name) for (kind, item_id), name in names.items())
+            keys = [entry[0] for entry in entries]
+        else:
+            # 在副本上删除、插入变化的条目，读取中的线程继续使用旧数组
+            entries, keys = list(self.entries), list(self.keys)
+            for entry in _build_entries(removed):
+                index = bisect_left(entries, entry)
+                if index < len(entries) and entries[index] == entry:
+                    del entries[index]
+                    del keys[index]
+            for entry in _build_entries(added):
+                index = bisect_left(entries, entry)
+                entries.insert(index, entry)
+                keys.insert(index, entry[0])
+
+        # 先整体替换再更新版本号，读取中的线程始终看到完整的数组
+        self.names, self.entries, self.keys = names, entries, keys
+        self.built_version = version
+
+    def lookup(self, prefix, limit):
+        """返回匹配键以 prefix 开头的条目（按匹配键排序），最多扫描 limit 倍的条目"""
+        entries, keys = self.entries, self.keys
+        # 匹配键只保存前 MAX_KEY_LENGTH 个字符，更长的输入按名称补充检查
+        key_prefix = prefix[:MAX_KEY_LENGTH]
+        matches = []
+        index = bisect_left(keys, key_prefix)
+        while index < len(keys) and keys[index].startswith(key_prefix) and len(matches) < limit * 4:
+            entry = entries[index]
+            if len(prefix) <= MAX_KEY_LENGTH or prefix in entry[4].lower():
+                matches.append(entry)
+            index += 1
+        return matches
+
+
+def _load_article_titles():
+    from .models import Article
+
+    rows = Article.query.filter_by(status='published').with_entities(Article.id, Article.title).all()
+    return [('article', article_id, title) for article_id, title in rows if title]
+
+
+def _load_tag_names():
+    from .models import Tag
+
+    rows = Tag.query.with_entities(Tag.id, Tag.name).all()
+    return [('tag', tag_id, name) for tag_id, name in rows if name]
+
+
+class SuggestionIndex:
+    """搜索建议索引（每个进程一份）"""
+
+    def __init__(self):
+        self._parts = (
+            _PrefixPart(VERSION_ARTICLES, _load_article_titles),
+            _PrefixPart(VERSION_TAGS, _load_tag_names),
+        )
+        self._lock = threading.Lock()
+
+    def _ensure_fresh(self):
+        current = dict(zip(
+            (part.version_name for part in self._parts),
+            versions.get(*(part.version_name for part in self._parts))
+        ))
+        if all(part.built_version == current[part.version_name] for part in self._parts):
+            return
+
+        with self._lock:
+            for part in self._parts:
+                part.refresh(current[part.version_name])
+
+    def suggest(self, query, limit=SUGGESTION_LIMIT):
+        """
+        返回与输入前缀匹配的建议列表 [{'type', 'id', 'text'}]
+        标签在前，同类中从名称开头匹配的在前，同一文章或标签只返回一次
+        """
+        prefix = (query or '').strip().lower()
+        if not prefix:
+            return []
+
+        self._ensure_fresh()
+
+        matches = []
+        for part in self._parts:
+            matches.extend(part.lookup(prefix, limit))
+        matches.sort(key=lambda entry: (entry[2] != 'tag', entry[1], len(entry[4]), entry[0]))
+
+        suggestions = []
+        seen = set()
+        for _, _, kind, item_id, name in matches:
+            if (kind, item_id) in seen:
+                continue
+            seen.add((kind, item_id))
+            suggestions.append({'type': kind, 'id': item_id, 'text': name})
+            if len(suggestions) >= limit:
+                break
+        return suggestions
+
+
+suggestion_index = SuggestionIndex()
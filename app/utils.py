@@ -55,48 +55,41 @@ def format_relative_time(dt):
         return f'{hours}小时前'
 
 
-def get_ip_location(ip_address):
-    """获取IP地址的地理位置信息"""
-    if not ip_address or ip_address in ['127.0.0.1', 'localhost', '::1']:
-        return '本地'
+def is_local_ip(ip_address):
+    """是否为本机地址（不需要查询归属地）"""
+    return not ip_address or ip_address in ['127.0.0.1', 'localhost', '::1']
+
+
+def lookup_local_ip_location(ip_address):
+    """
+    查询本地IP数据库（IPDB_PATH），微秒级、不访问网络；
+    未配置本地数据库时返回None，数据库中没有该地址时返回“未知地区”
+    """
+    from .ipdb import get_ip_database
     
-    try:
-        import requests
-        # 使用免费的ip-api.com服务，支持中文
-        response = requests.get(
-            f'http://ip-api.com/json/{ip_address}?lang=zh-CN',
-            timeout=3  # 3秒超时
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('status') == 'success':
-                country = data.get('country', '')
-                region = data.get('regionName', '')  # 省份/州
-                
-                # 如果是中国，显示省份
-                if country == '中国' or country == 'China':
-                    if region and region != country:
-                        # 处理一些特殊的省份名称
-                        if region.endswith('省') or region.endswith('市') or region.endswith('区'):
-                            return region
-                        else:
-                            return f'{region}省'
-                    else:
-                        return '中国'
-                # 其他国家显示国家名
-                elif country:
-                    return country
-                else:
-                    return '未知地区'
-            else:
-                return '未知地区'
-        else:
-            return '未知地区'
-            
-    except Exception as e:
-        # 网络错误或其他异常，返回未知地区
-        return '未知地区'
+    database = get_ip_database(current_app.config.get('IPDB_PATH'))
+    if database is None:
+        return None
+    return database.lookup(ip_address) or '未知地区'
+
+
+def fetch_ip_location(ip_address, timeout=3):
+    """请求在线接口（ip-api.com）查询归属地，网络错误或接口异常时抛出异常"""
+    import requests
+    from .ipdb import format_location
+    
+    # 使用免费的ip-api.com服务，支持中文
+    response = requests.get(
+        f'http://ip-api.com/json/{ip_address}?lang=zh-CN',
+        timeout=timeout
+    )
+    response.raise_for_status()
+    
+    data = response.json()
+    if data.get('status') == 'success':
+        # 中国显示省份，其他国家显示国家名
+        return format_location(data.get('country', ''), data.get('regionName', ''))
+    return '未知地区'
 
 
 # 保留兼容性的函数（但简化实现）
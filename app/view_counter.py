@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文章浏览数写缓冲模块
+浏览请求只在内存中累加计数，由后台线程按固定间隔合并为批量的
+UPDATE articles SET view_count = view_count + n 写入数据库，
+避免热门文章的每次浏览都在请求内提交事务、争抢同一行锁。
+每个进程（gunicorn worker）各自缓冲、各自写入，进程退出时写入剩余计数
+"""
+
+import os
+import atexit
+import threading
+from collections import defaultdict
+from sqlalchemy import update
+from . import db
+from .counters import adjust_published_views
+from .background import PeriodicTask
+
+
+# 单条UPDATE语句中 IN 列表的最大文章数
+FLUSH_BATCH_SIZE = 500
+
+
+def write_view_counts(pending):
+    """
+    将 {文章ID: 新增浏览数} 写入数据库并提交，返回写入的浏览数
+    相同增量的文章合并为一条UPDATE，只累加已发布文章，同时累加站点总浏览量
+    """
+    from .models import Article
+
+    by_amount = defaultdict(list)
+    for article_id, amount in pending.items():
+        by_amount[amount].append(article_id)
+
+    written = 0
+    for amount, article_ids in by_amount.items():
+        for start in range(0, len(article_ids), FLUSH_BATCH_SIZE):
+            result = db.session.execute(
+                update(Article)
+                .where(Article.id.in_(article_ids[start:start + FLUSH_BATCH_SIZE]),
+                       Article.status == 'published')
+                .values(view_count=Article.view_count + amount)
+                .execution_options(synchronize_session=False)
+            )
+            written += result.rowcount * amount
+
+    adjust_published_views(written)
+    db.session.commit()
+    return written
+
+
+class ViewCountBuffer:
+    """进程内浏览数缓冲区，后台线程定期批量写入"""
+
+    def __init__(self):
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._app = None
+        self._task = PeriodicTask('view-count-flusher', self._write_pending, 'VIEW_COUNT_FLUSH_INTERVAL')
+
+    def init_app(self, app):
+        """绑定应用并注册退出时的写入"""
+        if self._app is None:
+            atexit.register(self.shutdown)
+        self._app = app
+        self._task.init_app(app)
+        app.extensions['view_count_buffer'] = self
+
+    def add(self, article_id, count=1):
+        """累加浏览数，未启用缓冲时返回False，由调用方直接写入"""
+        if not self._task.ensure_started():
+            return False
+
+        with self._lock:
+            pid = os.getpid()
+            if self._pid != pid:
+                # fork后缓冲区中是父进程的计数，由父进程负责写入
+                self._pending = defaultdict(int)
+                self._pid = pid
+            self._pending[article_id] += count
+        return True
+
+    def discard(self, article_id):
+        """
+        丢弃文章尚未写入的浏览数（管理员直接修改浏览数时调用），返回丢弃的数量
+        只作用于当前进程，其他进程缓冲的浏览数仍会在下次写入时累加
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return 0
+            return self._pending.pop(article_id, 0)
+
+    def _write_pending(self):
+        """取出缓冲区中的全部浏览数写入数据库，失败时放回缓冲区等待下次写入"""
+        with self._lock:
+            if not self._pending or self._pid != os.getpid():
+                return 0
+            pending, self._pending = self._pending, defaultdict(int)
+
+        try:
+            return write_view_counts(pending)
+        except Exception:
+            with self._lock:
+                for article_id, amount in pending.items():
+                    self._pending[article_id] += amount
+            raise
+
+    def flush(self):
+        """立即写入缓冲区中的全部浏览数，返回写入的浏览数"""
+        return self._task.run_once() or 0
+
+    def shutdown(self):
+        """停止后台线程并写入剩余计数"""
+        self._task.stop()
+        if self._app is not None:
+            self.flush()
+
+
+view_buffer = ViewCountBuffer()
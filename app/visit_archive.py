@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+访客日志归档模块
+超过保留天数的原始访客日志（site_visits）按天导出为 gzip 压缩的 JSONL 文件
+（<归档目录>/<年>/<月>/site_visits-<日期>.jsonl.gz），写入完成后再分批从数据库删除，
+避免长时间锁表；删除前会先生成当天的统计汇总，统计页面不受影响。归档文件可按条件查询
+"""
+
+import os
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from . import db
+from .utils import get_local_now
+from .visit_stats import rollup_day, mark_archived_through
+
+
+ARCHIVE_FILE_PREFIX = 'site_visits-'
+ARCHIVE_FILE_SUFFIX = '.jsonl.gz'
+
+
+def archive_path(folder, day):
+    """某一天的归档文件路径"""
+    return os.path.join(folder, day.strftime('%Y'), day.strftime('%m'),
+                        f"{ARCHIVE_FILE_PREFIX}{day.strftime('%Y-%m-%d')}{ARCHIVE_FILE_SUFFIX}")
+
+
+def _visit_to_record(visit):
+    return {
+        'id': visit.id,
+        'visit_time': visit.visit_time.isoformat(),
+        'ip_address': visit.ip_address,
+        'session_id': visit.session_id,
+        'user_agent': visit.user_agent,
+        'referer': visit.referer,
+        'page_url': visit.page_url
+    }
+
+
+def read_archive(path):
+    """逐条读取归档文件中的访问记录"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _iter_day_visits(day, chunk_size):
+    """按主键分批读取某一天的原始访问记录"""
+    from .models import SiteVisit
+
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    last_id = 0
+    while True:
+        visits = SiteVisit.query.filter(
+            SiteVisit.visit_time >= start, SiteVisit.visit_time < end, SiteVisit.id > last_id
+        ).order_by(SiteVisit.id).limit(chunk_size).all()
+        if not visits:
+            break
+        yield visits
+        last_id = visits[-1].id
+        db.session.expunge_all()
+
+
+def archive_day(day, folder, chunk_size=1000, pause=0):
+    """
+    归档某一天的访问记录，返回归档的条数
+    先写入临时文件再改名，文件完整落盘后才删除数据库中的记录；
+    上次归档中途失败时，会与已有的归档文件合并，不会重复或丢失记录
+    """
+    from .models import SiteVisit
+
+    path = archive_path(folder, day)
+
+    # 删除原始记录前确保当天的统计汇总是完整的（归档文件已存在说明上次已汇总，部分记录可能已删除）
+    if not os.path.exists(path):
+        rollup_day(day)
+        db.session.commit()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+
+    archived_ids = []
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+        existing_ids = set()
+        if os.path.exists(path):
+            for record in read_archive(path):
+                existing_ids.add(record['id'])
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        for visits in _iter_day_visits(day, chunk_size):
+            for visit in visits:
+                if visit.id not in existing_ids:
+                    f.write(json.dumps(_visit_to_record(visit), ensure_ascii=False) + '\n')
+                archived_ids.append(visit.id)
+
+    if not archived_ids:
+        os.remove(temp_path)
+        return 0
+
+    os.replace(temp_path, path)
+
+    # 记录归档进度，之后不再根据原始日志重新汇总这一天
+    mark_archived_through(day)
+    db.session.commit()
+
+    # 分批删除，每批单独提交，缩短锁表时间
+    for start in range(0, len(archived_ids), chunk_size):
+        SiteVisit.query.filter(SiteVisit.id.in_(archived_ids[start:start + chunk_size]))\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        if pause:
+            time.sleep(pause)
+
+    return len(archived_ids)
+
+
+def archive_old_visits(retention_days, folder, chunk_size=1000, pause=0, progress=None):
+    """
+    归档早于保留天数的全部访问记录，返回 {日期: 条数}
+    progress: 每归档完一天后调用的回调函数，参数为 (日期, 条数)
+    """
+    from .models import SiteVisit
+
+    cutoff_day = get_local_now().date() - timedelta(days=retention_days)
+    cutoff = datetime.combine(cutoff_day, datetime.min.time())
+
+    results = {}
+    while True:
+        first_visit = db.session.query(func.min(SiteVisit.visit_time))\
+            .filter(SiteVisit.visit_time < cutoff).scalar()
+        if first_visit is None:
+            break
+
+        day = first_visit.date()
+        results[day] = archive_day(day, folder, chunk_size, pause)
+        if progress:
+            progress(day, results[day])
+    return results
+
+
+def list_archives(folder, start_day=None, end_day=None):
+    """列出日期范围内的归档文件，返回 [(日期, 路径)]，按日期排序"""
+    archives = []
+    if not os.path.isdir(folder):
+        return archives
+
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if not (name.startswith(ARCHIVE_FILE_PREFIX) and name.endswith(ARCHIVE_FILE_SUFFIX)):
+                continue
+            try:
+                day = datetime.strptime(name[len(ARCHIVE_FILE_PREFIX):-len(ARCHIVE_FILE_SUFFIX)], '%Y-%m-%d').date()
+            except ValueError:
+                continue
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            archives.append((day, os.path.join(root, name)))
+    return sorted(archives)
+
+
+def query_archives(folder, start_day=None, end_day=None, ip_address=None, page_url=None, session_id=None):
+    """按条件查询归档的访问记录（page_url 为包含匹配），逐条返回"""
+    for _, path in list_archives(folder, start_day, end_day):
+        for record in read_archive(path):
+            if ip_address and record.get('ip_address') != ip_address:
+                continue
+            if session_id and record.get('session_id') != session_id:
+                continue
+            if page_url and page_url not in (record.get('page_url') or ''):
+                continue
+            yield record
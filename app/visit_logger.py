@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+访客日志写入模块
+请求中只做内存去重并放入有界队列，由后台线程定期取出、批量插入 site_visits，
+页面响应不再包含访客日志的查询和提交。队列满时直接丢弃并计数，不阻塞请求
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+from collections import OrderedDict
+from sqlalchemy import insert
+from . import db
+from .background import PeriodicTask
+
+
+class VisitLogger:
+    """访客日志缓冲：内存LRU去重 + 有界队列 + 后台批量写入"""
+
+    def __init__(self):
+        self._queue = None
+        self._recent = OrderedDict()  # (session_id, page_url) -> 最近记录时间
+        self._lock = threading.Lock()
+        self._pid = None
+        self._app = None
+        self._counters = {'enqueued': 0, 'deduplicated': 0, 'dropped': 0, 'written': 0, 'failed': 0}
+        self._task = PeriodicTask('visit-log-writer', self._write_queued, 'STATS_FLUSH_INTERVAL')
+
+    def init_app(self, app):
+        """绑定应用并注册退出时的写入"""
+        if self._app is None:
+            atexit.register(self.shutdown)
+        self._app = app
+        self._task.init_app(app)
+        app.extensions['visit_logger'] = self
+
+    def _ensure_process(self):
+        """按进程初始化队列（fork后不沿用父进程的队列和去重记录）"""
+        pid = os.getpid()
+        if self._pid != pid:
+            self._queue = queue.Queue(maxsize=self._app.config.get('STATS_QUEUE_SIZE', 10000))
+            self._recent = OrderedDict()
+            self._pid = pid
+
+    def _is_duplicate(self, key, now):
+        """同一会话在超时时间内重复访问同一页面时返回True，否则记录本次访问"""
+        timeout = self._app.config.get('STATS_SESSION_TIMEOUT', 5) * 60
+        max_keys = self._app.config.get('STATS_DEDUPE_SIZE', 50000)
+
+        last_time = self._recent.get(key)
+        if last_time is not None and now - last_time < timeout:
+            return True
+
+        self._recent[key] = now
+        self._recent.move_to_end(key)
+        while len(self._recent) > max_keys:
+            self._recent.popitem(last=False)
+        return False
+
+    def record(self, visit_time, ip_address, session_id, user_agent, referer, page_url):
+        """记录一次访问（请求中调用），返回是否已放入队列"""
+        row = {
+            'visit_time': visit_time,
+            'ip_address': ip_address,
+            'session_id': session_id,
+            'user_agent': user_agent,
+            'referer': referer,
+            'page_url': page_url
+        }
+
+        with self._lock:
+            self._ensure_process()
+            if self._is_duplicate((session_id, page_url), time.monotonic()):
+                self._counters['deduplicated'] += 1
+                return False
+
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                # 写入跟不上时丢弃，保证页面响应不受影响
+                self._counters['dropped'] += 1
+                return False
+            self._counters['enqueued'] += 1
+
+        # 未启用后台写入时在请求中直接写入
+        if not self._task.ensure_started():
+            self.flush()
+        return True
+
+    def _write_queued(self):
+        """取出队列中的全部访问记录，分批插入数据库，返回写入的条数"""
+        from .models import SiteVisit
+
+        if self._queue is None or self._pid != os.getpid():
+            return 0
+
+        batch_size = self._app.config.get('STATS_BATCH_SIZE', 500)
+        written = 0
+        while True:
+            rows = []
+            while len(rows) < batch_size:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not rows:
+                break
+
+            try:
+                db.session.execute(insert(SiteVisit), rows)
+                db.session.commit()
+            except Exception:
+                with self._lock:
+                    self._counters['failed'] += len(rows)
+                raise
+
+            written += len(rows)
+            with self._lock:
+                self._counters['written'] += len(rows)
+
+        return written
+
+    def flush(self):
+        """立即写入队列中的全部访问记录"""
+        return self._task.run_once() or 0
+
+    def get_stats(self):
+        """当前进程的队列状态和计数（入队、去重、丢弃、写入、失败）"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['queued'] = self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+        return stats
+
+    def shutdown(self):
+        """停止后台线程并写入剩余记录"""
+        self._task.stop()
+        if self._app is not None:
+            self.flush()
+
+
+visit_logger = VisitLogger()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+访问统计汇总模块
+由汇总任务按天扫描原始访客日志（site_visits），生成日/小时汇总、每日访客IP、
+热门页面和来源页面汇总表；统计页面和任意日期范围的查询都只读取汇总表。
+多天范围的独立访客数默认合并每天的HyperLogLog概要估算（误差见 hll 模块），
+前天及更早日期的合并结果按汇总版本缓存并逐日追加，每次只需再合并最近两天的概要；
+配置 STATS_EXACT_UNIQUE 后改为按每日访客IP表精确去重
+"""
+
+import time
+from types import SimpleNamespace
+from datetime import date, datetime, timedelta
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import func, update, insert
+from . import db
+from .utils import get_local_now
+from .background import PeriodicTask
+from .hll import HyperLogLog
+from .cache import local_cache, versions, bump_versions, VERSION_VISIT_ROLLUPS
+
+
+# 记录上次汇总时间的计数器名称，用于多个进程之间避免重复执行汇总任务
+ROLLUP_CLAIM_COUNTER = 'visit_rollup_at'
+
+# 记录原始日志已归档到哪一天的计数器名称（值为日期序数），这些日期只能保留已有的汇总
+ARCHIVED_THROUGH_COUNTER = 'visit_archived_through'
+
+# 合并后的多日概要在进程内的缓存时间（秒）
+MERGED_SKETCH_CACHE_TIMEOUT = 86400
+
+
+def get_archived_through():
+    """原始访客日志已归档（从数据库删除）的最后一天，没有归档时返回None"""
+    from .models import SiteCounter
+
+    value = db.session.query(SiteCounter.value).filter_by(name=ARCHIVED_THROUGH_COUNTER).scalar()
+    return date.fromordinal(value) if value else None
+
+
+def mark_archived_through(day):
+    """记录原始日志已归档到的日期（随当前会话一起提交）"""
+    from .counters import set_counter
+
+    archived_through = get_archived_through()
+    if archived_through is None or day > archived_through:
+        set_counter(ARCHIVED_THROUGH_COUNTER, day.toordinal())
+
+
+def _day_range(day):
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def _build_sketch(values):
+    """将一组IP生成序列化的HyperLogLog概要"""
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch.to_bytes()
+
+
+def rollup_day(day):
+    """
+    重新生成某一天的全部汇总数据（随当前会话一起提交），返回当天的访问次数
+    汇总的是前天及更早的日期时递增汇总版本，使缓存的多日合并概要失效
+    """
+    from .models import (
+        SiteVisit, VisitDailyStat, VisitHourlyStat, VisitDailyIp,
+        VisitPageDailyStat, VisitRefererDailyStat
+    )
+
+    start, end = _day_range(day)
+
+    visits = 0
+    ip_visits = defaultdict(int)
+    ip_sketch = HyperLogLog()
+    hourly_visits = defaultdict(int)
+    hourly_ips = defaultdict(set)
+    page_visits = defaultdict(int)
+    page_ips = defaultdict(set)
+    referer_visits = defaultdict(int)
+
+    rows = db.session.query(
+        SiteVisit.visit_time, SiteVisit.ip_address, SiteVisit.page_url, SiteVisit.referer
+    ).filter(SiteVisit.visit_time >= start, SiteVisit.visit_time < end).yield_per(5000)
+
+    for visit_time, ip_address, page_url, referer in rows:
+        hour = visit_time.replace(minute=0, second=0, microsecond=0)
+        visits += 1
+        if ip_address not in ip_visits:
+            ip_sketch.add(ip_address)
+        ip_visits[ip_address] += 1
+        hourly_visits[hour] += 1
+        hourly_ips[hour].add(ip_address)
+        if page_url:
+            page_visits[page_url] += 1
+            page_ips[page_url].add(ip_address)
+        if referer:
+            referer_visits[referer] += 1
+
+    # 先删除当天的旧汇总再整体写入，重复执行结果不变
+    VisitHourlyStat.query.filter(VisitHourlyStat.hour >= start, VisitHourlyStat.hour < end)\
+        .delete(synchronize_session=False)
+    for model in (VisitDailyIp, VisitPageDailyStat, VisitRefererDailyStat):
+        model.query.filter(model.day == day).delete(synchronize_session=False)
+
+    daily = db.session.get(VisitDailyStat, day)
+    if daily is None:
+        daily = VisitDailyStat(day=day)
+        db.session.add(daily)
+    daily.visits = visits
+    daily.unique_ips = len(ip_visits)
+    daily.ip_sketch = ip_sketch.to_bytes()
+    daily.updated_at = get_local_now()
+
+    if hourly_visits:
+        db.session.execute(insert(VisitHourlyStat), [
+            {'hour': hour, 'visits': count, 'unique_ips': len(hourly_ips[hour])}
+            for hour, count in hourly_visits.items()
+        ])
+    if ip_visits:
+        db.session.execute(insert(VisitDailyIp), [
+            {'day': day, 'ip_address': ip_address, 'visits': count}
+            for ip_address, count in ip_visits.items()
+        ])
+    if page_visits:
+        db.session.execute(insert(VisitPageDailyStat), [
+            {'day': day, 'page_url': page_url, 'visits': count, 'unique_ips': len(page_ips[page_url]),
+             'ip_sketch': _build_sketch(page_ips[page_url])}
+            for page_url, count in page_visits.items()
+        ])
+    if referer_visits:
+        db.session.execute(insert(VisitRefererDailyStat), [
+            {'day': day, 'referer': referer, 'visits': count}
+            for referer, count in referer_visits.items()
+        ])
+
+    if day <= _settled_through():
+        bump_versions(VERSION_VISIT_ROLLUPS)
+    return visits
+
+
+def build_visit_rollups(start_day=None, end_day=None):
+    """
+    生成 [start_day, end_day] 范围内每天的汇总数据，每天单独提交，返回处理的天数
+    未指定开始日期时从原始日志中最早的一天开始，未指定结束日期时到今天为止；
+    原始日志已归档的日期保留已有汇总，不会重新生成
+    """
+    from .models import SiteVisit
+
+    if start_day is None:
+        first_visit = db.session.query(func.min(SiteVisit.visit_time)).scalar()
+        if first_visit is None:
+            return 0
+        start_day = first_visit.date()
+    if end_day is None:
+        end_day = get_local_now().date()
+
+    archived_through = get_archived_through()
+    if archived_through is not None:
+        start_day = max(start_day, archived_through + timedelta(days=1))
+
+    day_count = 0
+    day = start_day
+    while day <= end_day:
+        rollup_day(day)
+        db.session.commit()
+        day_count += 1
+        day += timedelta(days=1)
+    return day_count
+
+
+def _claim_rollup_run(interval):
+    """抢占本轮汇总任务：距上次汇总不足间隔时间（其他进程刚执行过）时返回False"""
+    from .models import SiteCounter
+    from .counters import set_counter
+
+    now_ts = int(time.time())
+    result = db.session.execute(
+        update(SiteCounter)
+        .where(SiteCounter.name == ROLLUP_CLAIM_COUNTER, SiteCounter.value <= now_ts - interval)
+        .values(value=now_ts, updated_at=get_local_now())
+    )
+    if result.rowcount == 0:
+        if db.session.get(SiteCounter, ROLLUP_CLAIM_COUNTER) is not None:
+            db.session.rollback()
+            return False
+        set_counter(ROLLUP_CLAIM_COUNTER, now_ts)
+    db.session.commit()
+    return True
+
+
+def refresh_recent_rollups():
+    """定期任务：重新汇总昨天和今天的数据（昨天的数据在零点后可能仍有写入）"""
+    if not _claim_rollup_run(rollup_task.interval):
+        return 0
+
+    today = get_local_now().date()
+    return build_visit_rollups(today - timedelta(days=1), today)
+
+
+# 定期汇总访问统计的后台任务
+rollup_task = PeriodicTask('visit-rollup', refresh_recent_rollups, 'STATS_ROLLUP_INTERVAL')
+
+
+def _exact_unique_enabled():
+    return current_app.config.get('STATS_EXACT_UNIQUE', False)
+
+
+def _settled_through():
+    """汇总不再变化的最后一天（定期任务只重新汇总昨天和今天）"""
+    return get_local_now().date() - timedelta(days=2)
+
+
+def _load_sketches(page_url, start_day, end_day):
+    """读取日期范围内每天的概要（page_url为None时读取全站概要），start_day为None表示从最早一天开始"""
+    from .models import VisitDailyStat, VisitPageDailyStat
+
+    if page_url is None:
+        query = db.session.query(VisitDailyStat.ip_sketch)
+        day_column = VisitDailyStat.day
+    else:
+        query = db.session.query(VisitPageDailyStat.ip_sketch).filter(VisitPageDailyStat.page_url == page_url)
+        day_column = VisitPageDailyStat.day
+    if start_day is not None:
+        query = query.filter(day_column >= start_day)
+    return [ip_sketch for ip_sketch, in query.filter(day_column <= end_day)]
+
+
+def _merged_sketch(page_url, start_day, end_day):
+    """
+    合并日期范围内每天的概要：前天及更早的部分按汇总版本缓存（日期推进时只追加新的日期），
+    最近两天的概要每次读取后合并，合并次数与范围的天数无关
+    """
+    settled_through = _settled_through()
+    settled_end = min(end_day, settled_through)
+
+    merged = HyperLogLog()
+    if start_day is None or start_day <= settled_end:
+        # 结束日期在已稳定的日期内时范围固定；否则同一开始日期的缓存随日期推进逐日追加
+        key = ('visit_sketch', page_url, start_day, end_day if end_day < settled_through else None)
+        current_versions = versions.get(VERSION_VISIT_ROLLUPS)
+        cached = local_cache.get(key, current_versions)
+        if cached is not None and cached[0] <= settled_end:
+            through_day, registers = cached
+            settled = HyperLogLog(registers=registers)
+            if through_day < settled_end:
+                settled.merge(HyperLogLog.merge_all(
+                    _load_sketches(page_url, through_day + timedelta(days=1), settled_end)
+                ))
+        else:
+            settled = HyperLogLog.merge_all(_load_sketches(page_url, start_day, settled_end))
+        local_cache.set(key, (settled_end, bytes(settled.registers)), current_versions, MERGED_SKETCH_CACHE_TIMEOUT)
+        merged.merge(settled)
+
+    recent_start = settled_end + timedelta(days=1)
+    if start_day is not None:
+        recent_start = max(recent_start, start_day)
+    if recent_start <= end_day:
+        merged.merge(HyperLogLog.merge_all(_load_sketches(page_url, recent_start, end_day)))
+    return merged
+
+
+def _count_unique_ips(start_day, end_day):
+    """日期范围内的独立访客数（跨天按IP去重）：默认合并每日概要估算，可配置为精确去重"""
+    from .models import VisitDailyIp, VisitDailyStat
+
+    if _exact_unique_enabled():
+        query = db.session.query(func.count(func.distinct(VisitDailyIp.ip_address)))
+        if start_day is not None:
+            query = query.filter(VisitDailyIp.day >= start_day, VisitDailyIp.day <= end_day)
+        return query.scalar() or 0
+
+    # 单日直接返回汇总时计算的精确值
+    if start_day is not None and start_day == end_day:
+        return db.session.query(VisitDailyStat.unique_ips).filter_by(day=start_day).scalar() or 0
+    return _merged_sketch(None, start_day, end_day or get_local_now().date()).count()
+
+
+def _sum_visits(start_day, end_day):
+    """日期范围内的访问次数"""
+    from .models import VisitDailyStat
+
+    query = db.session.query(func.sum(VisitDailyStat.visits))
+    if start_day is not None:
+        query = query.filter(VisitDailyStat.day >= start_day, VisitDailyStat.day <= end_day)
+    return query.scalar() or 0
+
+
+def get_visit_summary(start_day=None, end_day=None):
+    """日期范围内的访问次数和独立访客数，未指定范围时统计全部数据"""
+    return {
+        'visits': _sum_visits(start_day, end_day),
+        'unique': _count_unique_ips(start_day, end_day)
+    }
+
+
+def get_site_stats():
+    """统计页面顶部的总体数据：全部、今日、最近7天的访问次数和独立访客数"""
+    today = get_local_now().date()
+    total = get_visit_summary()
+    today_summary = get_visit_summary(today, today)
+    week = get_visit_summary(today - timedelta(days=6), today)
+    return {
+        'total_visits': total['visits'],
+        'unique_visitors': total['unique'],
+        'today_visits': today_summary['visits'],
+        'today_unique': today_summary['unique'],
+        'week_visits': week['visits'],
+        'week_unique': week['unique']
+    }
+
+
+def get_daily_stats(start_day, end_day):
+    """日期范围内每天的访问次数和独立访客数（没有数据的日期补0）"""
+    from .models import VisitDailyStat
+
+    rows = VisitDailyStat.query.filter(VisitDailyStat.day >= start_day, VisitDailyStat.day <= end_day).all()
+    by_day = {row.day: row for row in rows}
+
+    daily_stats = []
+    day = start_day
+    while day <= end_day:
+        row = by_day.get(day)
+        daily_stats.append({
+            'date': day.strftime('%m-%d'),
+            'visits': row.visits if row else 0,
+            'unique': row.unique_ips if row else 0
+        })
+        day += timedelta(days=1)
+    return daily_stats
+
+
+def get_hourly_stats(day):
+    """某一天每小时的访问次数和独立访客数"""
+    from .models import VisitHourlyStat
+
+    start, end = _day_range(day)
+    rows = VisitHourlyStat.query.filter(VisitHourlyStat.hour >= start, VisitHourlyStat.hour < end).all()
+    by_hour = {row.hour.hour: row for row in rows}
+    return [{
+        'hour': hour,
+        'visits': by_hour[hour].visits if hour in by_hour else 0,
+        'unique': by_hour[hour].unique_ips if hour in by_hour else 0
+    } for hour in range(24)]
+
+
+def get_popular_pages(start_day, end_day, limit=10):
+    """
+    日期范围内的热门页面，返回 (page_url, visit_count, unique_visitors) 列表
+    多天范围的独立访客合并每天的概要估算
+    """
+    from .models import VisitPageDailyStat
+
+    visit_count = func.sum(VisitPageDailyStat.visits).label('visit_count')
+    in_range = (VisitPageDailyStat.day >= start_day, VisitPageDailyStat.day <= end_day)
+    top_pages = db.session.query(
+        VisitPageDailyStat.page_url,
+        visit_count
+    ).filter(*in_range).group_by(VisitPageDailyStat.page_url)\
+        .order_by(visit_count.desc()).limit(limit).all()
+    if not top_pages:
+        return []
+
+    # 单日直接使用汇总时计算的精确值，多天合并概要（已稳定日期的合并结果有缓存）
+    exact_unique = {}
+    if start_day == end_day:
+        exact_unique = dict(db.session.query(VisitPageDailyStat.page_url, VisitPageDailyStat.unique_ips).filter(
+            *in_range, VisitPageDailyStat.page_url.in_([page.page_url for page in top_pages])
+        ))
+
+    results = []
+    for page in top_pages:
+        if start_day == end_day:
+            unique_visitors = exact_unique.get(page.page_url, 0)
+        else:
+            unique_visitors = _merged_sketch(page.page_url, start_day, end_day).count()
+        results.append(SimpleNamespace(
+            page_url=page.page_url, visit_count=page.visit_count, unique_visitors=unique_visitors
+        ))
+    return results
+
+
+def get_top_referers(start_day, end_day, limit=10):
+    """日期范围内的主要来源页面，返回 (referer, visit_count) 列表"""
+    from .models import VisitRefererDailyStat
+
+    visit_count = func.sum(VisitRefererDailyStat.visits).label('visit_count')
+    return db.session.query(
+        VisitRefererDailyStat.referer,
+        visit_count
+    ).filter(
+        VisitRefererDailyStat.day >= start_day, VisitRefererDailyStat.day <= end_day
+    ).group_by(VisitRefererDailyStat.referer).order_by(visit_count.desc()).limit(limit).all()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+访客日志归档脚本
+将超过保留天数的访客日志导出为按天分区的 gzip JSONL 文件并从数据库分批删除，
+并支持查询已归档的记录。建议通过cron每天执行一次归档
+
+使用方法：
+python archive_visits.py --archive                    # 按配置的保留天数（STATS_RETENTION_DAYS）归档
+python archive_visits.py --archive --retention 30     # 归档30天以前的记录
+python archive_visits.py --list                       # 列出归档文件
+python archive_visits.py --query --start 2024-01-01 --end 2024-01-31 --ip 1.2.3.4
+python archive_visits.py --query --page /article/1 --count   # 只输出匹配的记录数
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from app.visit_archive import archive_old_visits, list_archives, query_archives
+
+
+def parse_date(value):
+    """解析 YYYY-MM-DD 格式的日期参数"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'日期格式应为 YYYY-MM-DD: {value}')
+
+
+def run_archive(app, args):
+    """归档超过保留天数的访客日志"""
+    retention_days = args.retention or app.config.get('STATS_RETENTION_DAYS', 90)
+    if retention_days < 2:
+        # 昨天和今天的汇总仍会定期根据原始日志重新生成
+        print("❌ 保留天数不能少于2天")
+        return False
+
+    folder = app.config['STATS_ARCHIVE_FOLDER']
+    chunk_size = args.chunk_size or app.config.get('STATS_ARCHIVE_CHUNK_SIZE', 1000)
+    print(f"🔄 归档 {retention_days} 天以前的访客日志到 {folder} ...")
+
+    def progress(day, count):
+        print(f"   {day}: {count} 条")
+
+    try:
+        results = archive_old_visits(retention_days, folder, chunk_size, args.pause, progress)
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ 归档失败: {str(e)}")
+        return False
+
+    print(f"✅ 归档完成（共 {len(results)} 天，{sum(results.values())} 条）")
+    return True
+
+
+def run_list(app, args):
+    """列出归档文件"""
+    archives = list_archives(app.config['STATS_ARCHIVE_FOLDER'], args.start, args.end)
+    if not archives:
+        print("暂无归档文件")
+        return True
+
+    total_size = 0
+    for day, path in archives:
+        size = os.path.getsize(path)
+        total_size += size
+        print(f"{day}  {size / 1024:10.1f} KB  {path}")
+    print(f"共 {len(archives)} 个文件，{total_size / 1024 / 1024:.2f} MB")
+    return True
+
+
+def run_query(app, args):
+    """查询归档的访问记录，每行输出一条JSON"""
+    records = query_archives(
+        app.config['STATS_ARCHIVE_FOLDER'],
+        start_day=args.start,
+        end_day=args.end,
+        ip_address=args.ip,
+        page_url=args.page,
+        session_id=args.session
+    )
+
+    count = 0
+    for record in records:
+        count += 1
+        if not args.count:
+            print(json.dumps(record, ensure_ascii=False))
+        if args.limit and count >= args.limit:
+            break
+
+    if args.count:
+        print(count)
+    return True
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='访客日志归档和查询脚本')
+    parser.add_argument('--archive', action='store_true', help='归档超过保留天数的访客日志')
+    parser.add_argument('--list', action='store_true', help='列出归档文件')
+    parser.add_argument('--query', action='store_true', help='查询已归档的访问记录')
+    parser.add_argument('--retention', type=int, help='保留天数，默认使用配置 STATS_RETENTION_DAYS')
+    parser.add_argument('--chunk-size', type=int, help='每批读取、删除的记录数')
+    parser.add_argument('--pause', type=float, default=0, help='每批删除后暂停的秒数，降低对线上访问的影响')
+    parser.add_argument('--start', type=parse_date, help='开始日期（YYYY-MM-DD）')
+    parser.add_argument('--end', type=parse_date, help='结束日期（YYYY-MM-DD）')
+    parser.add_argument('--ip', help='按访客IP筛选')
+    parser.add_argument('--page', help='按页面URL筛选（包含匹配）')
+    parser.add_argument('--session', help='按会话ID筛选')
+    parser.add_argument('--limit', type=int, help='最多输出的记录数')
+    parser.add_argument('--count', action='store_true', help='只输出匹配的记录数')
+
+    args = parser.parse_args()
+
+    if not any([args.archive, args.list, args.query]):
+        parser.print_help()
+        return
+
+    # 从环境变量获取配置，默认为development
+    config_name = os.getenv('FLASK_CONFIG', 'development')
+    app = create_app(config_name)
+    with app.app_context():
+        if args.archive:
+            success = run_archive(app, args)
+        elif args.list:
+            success = run_list(app, args)
+        else:
+            success = run_query(app, args)
+
+        if not success:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Markdown渲染性能基准脚本
+对比"每次新建Markdown实例"与"线程内复用实例"两种方式的单次渲染耗时
+
+使用方法：
+python bench_markdown.py                  # 使用内置示例文章
+python bench_markdown.py --file post.md   # 使用指定的Markdown文件
+python bench_markdown.py --rounds 500     # 指定渲染次数
+"""
+
+import os
+import sys
+import argparse
+import timeit
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.renderer import create_markdown, render_markdown
+
+
+SAMPLE_SECTION = """## 第{index}节 示例标题
+
+这是一段用于基准测试的正文，包含**加粗**、*斜体*、`行内代码`和[链接](https://example.com)。
+第二行文字用于触发 nl2br 扩展的换行处理。
+
+| 列A | 列B | 列C |
+| --- | --- | --- |
+| 1   | 2   | 3   |
+| 4   | 5   | 6   |
+
+```python
+def hello(name):
+    return f'hello {{name}}'
+```
+
+- 列表项一
+- 列表项二
+- 列表项三
+
+"""
+
+
+def build_sample_article(sections=20):
+    """生成一篇带目录、表格、代码块的示例文章"""
+    return '# 基准测试文章\n\n' + ''.join(SAMPLE_SECTION.format(index=i) for i in range(sections))
+
+
+def render_with_new_instance(text):
+    """旧实现：每次渲染都新建Markdown实例"""
+    md = create_markdown()
+    html = md.convert(text)
+    return html, md.toc
+
+
+def bench(func, text, rounds):
+    """返回单次渲染的平均耗时（毫秒）"""
+    func(text)  # 预热
+    total = timeit.timeit(lambda: func(text), number=rounds)
+    return total / rounds * 1000
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Markdown渲染性能基准')
+    parser.add_argument('--file', help='用于测试的Markdown文件，默认使用内置示例')
+    parser.add_argument('--rounds', type=int, default=200, help='每种方式的渲染次数')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = build_sample_article()
+
+    # 两种方式的输出必须一致
+    if render_with_new_instance(text) != render_markdown(text):
+        print("❌ 复用实例的渲染结果与新建实例不一致")
+        sys.exit(1)
+
+    print(f"文章长度: {len(text)} 字符, 渲染次数: {args.rounds}")
+
+    # 短文本更能体现实例创建的固定开销
+    for label, sample in (('短文本', '# 标题\n\n一段简短的评论内容'), ('示例文章', text)):
+        before = bench(render_with_new_instance, sample, args.rounds)
+        after = bench(render_markdown, sample, args.rounds)
+        print(f"{label}: 新建实例 {before:.3f} ms/次, 复用实例 {after:.3f} ms/次, "
+              f"提升 {before / after:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
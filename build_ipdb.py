@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+离线IP数据库生成脚本
+将CSV格式的IP段数据（如 DB-IP、IP2Location LITE 的免费CSV，或 网段CIDR,国家,省份 格式）
+编译为评论归属地查询使用的二进制数据库（默认写入配置 IPDB_PATH），生成后重启应用生效
+
+使用方法：
+python build_ipdb.py --csv dbip-city-lite.csv --country-column 3 --region-column 4
+python build_ipdb.py --csv ipv4.csv --csv ipv6.csv            # 合并多个CSV文件
+python build_ipdb.py --csv ranges.csv --output data/ipdb.bin
+python build_ipdb.py --lookup 1.2.3.4                         # 查询已生成的数据库
+"""
+
+import os
+import sys
+import time
+import argparse
+from itertools import chain
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import config
+from app.ipdb import parse_csv_ranges, build_database, IPDatabase
+
+
+def run_build(args, output):
+    """读取CSV文件并生成数据库"""
+    for path in args.csv:
+        if not os.path.exists(path):
+            print(f"❌ 文件不存在: {path}")
+            return False
+
+    print(f"🔄 读取 {len(args.csv)} 个CSV文件...")
+    ranges = chain.from_iterable(
+        parse_csv_ranges(path, args.country_column, args.region_column, args.encoding)
+        for path in args.csv
+    )
+
+    try:
+        counts = build_database(ranges, output)
+    except OSError as e:
+        print(f"❌ 生成IP数据库失败: {str(e)}")
+        return False
+
+    size = os.path.getsize(output)
+    print(f"✅ IP数据库生成完成: {output}（IPv4 {counts[4]} 段，IPv6 {counts[6]} 段，{size / 1024 / 1024:.2f} MB）")
+    return True
+
+
+def run_lookup(args, output):
+    """查询已生成的数据库"""
+    if not os.path.exists(output):
+        print(f"❌ IP数据库不存在: {output}")
+        return False
+
+    database = IPDatabase(output)
+    for ip_address in args.lookup:
+        start = time.perf_counter()
+        location = database.lookup(ip_address)
+        elapsed = (time.perf_counter() - start) * 1000000
+        print(f"{ip_address}  {location or '未找到'}  ({elapsed:.1f} µs)")
+    database.close()
+    return True
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='离线IP数据库生成脚本')
+    parser.add_argument('--csv', action='append', help='IP段CSV文件，可指定多次')
+    parser.add_argument('--lookup', action='append', help='查询IP地址的归属地，可指定多次')
+    parser.add_argument('--output', help='数据库文件路径，默认使用配置 IPDB_PATH')
+    parser.add_argument('--country-column', type=int, help='国家所在列（从0开始），默认紧跟在IP列之后')
+    parser.add_argument('--region-column', type=int, help='省份/州所在列（从0开始），默认在国家列之后')
+    parser.add_argument('--encoding', default='utf-8', help='CSV文件编码')
+
+    args = parser.parse_args()
+
+    if not args.csv and not args.lookup:
+        parser.print_help()
+        return
+
+    # 从环境变量获取配置，默认为development
+    config_name = os.getenv('FLASK_CONFIG', 'development')
+    output = args.output or config[config_name].IPDB_PATH
+
+    success = run_build(args, output) if args.csv else run_lookup(args, output)
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
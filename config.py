@@ -30,10 +30,44 @@ class Config:
     # 点赞功能配置
     LIKE_RATE_LIMIT = 100  # 每小时点赞数限制
     LIKE_SESSION_TRACKING = True  # 是否启用session跟踪
+    LIKE_COUNTER_SLOTS = 16  # 每篇文章的点赞计数分片数，分片越多热门文章并发点赞越快
+    LIKE_COUNT_CACHE_TIMEOUT = 5  # 点赞数（含未合并分片）的缓存时间（秒）
+    LIKE_FOLD_INTERVAL = 60  # 将点赞分片合并回文章点赞数的间隔（秒），0表示不在进程内合并（可用 init_db.py --fold-likes 定时执行）
     
     # 访问统计配置
     STATS_ENABLE_VISITOR_LOG = True  # 是否记录访客日志
     STATS_SESSION_TIMEOUT = 30  # 访客session超时时间（分钟）
+    STATS_FLUSH_INTERVAL = 5  # 访客日志批量写入间隔（秒），0表示在请求中直接写入
+    STATS_QUEUE_SIZE = 10000  # 每个进程待写入访客日志的队列上限，超出时丢弃并计数
+    STATS_BATCH_SIZE = 500  # 每条INSERT语句写入的访客日志条数
+    STATS_DEDUPE_SIZE = 50000  # 内存去重记录（会话+页面）的最大条数
+    STATS_EXACT_UNIQUE = False  # 多日独立访客是否精确去重；默认合并每日HyperLogLog概要估算（标准误差约1.6%）
+    STATS_RETENTION_DAYS = 90  # 原始访客日志在数据库中保留的天数，更早的记录由 archive_visits.py 归档
+    STATS_ARCHIVE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archives', 'site_visits')  # 访客日志归档目录
+    STATS_ARCHIVE_CHUNK_SIZE = 1000  # 归档时每批读取、删除的记录数
+    STATS_ROLLUP_INTERVAL = 300  # 重新汇总昨天和今天访问统计的间隔（秒），0表示不在进程内汇总（可用 init_db.py --build-rollups 定时执行）
+    VIEW_COUNT_FLUSH_INTERVAL = 10  # 文章浏览数批量写入间隔（秒），0表示每次浏览直接写入数据库
+    
+    # IP归属地配置
+    IPDB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ipdb.bin')  # 本地IP数据库（由 build_ipdb.py 生成）
+    IP_LOCATION_ONLINE_LOOKUP = True  # 没有本地IP数据库时是否请求在线接口查询归属地
+    GEO_CACHE_SIZE = 10000  # 每个进程缓存的IP归属地条数
+    GEO_CACHE_TIMEOUT = 86400  # IP归属地缓存时间（秒）
+    GEO_RESOLVE_INTERVAL = 2  # 后台回填评论归属地的间隔（秒），0表示提交评论后在请求中直接查询
+    GEO_QUEUE_SIZE = 1000  # 每个进程待回填归属地的评论队列上限，超出时不再回填
+    GEO_REQUEST_TIMEOUT = 3  # 在线接口请求超时（秒）
+    GEO_BREAKER_THRESHOLD = 5  # 在线接口连续失败多少次后熔断
+    GEO_BREAKER_COOLDOWN = 60  # 熔断后多少秒再试探请求
+    GEO_RETRY_LIMIT = 5  # 查询失败的评论最多重试次数
+    GEO_RETRY_DELAY = 30  # 首次重试的等待时间（秒），之后每次翻倍
+    GEO_RETRY_MAX_DELAY = 900  # 重试等待时间上限（秒）
+    
+    # 缓存配置
+    CACHE_VERSION_CHECK_INTERVAL = 5  # 重新加载缓存版本号的间隔（秒），即其他进程感知失效的最大延迟
+    SIDEBAR_CACHE_TIMEOUT = 300  # 首页/搜索页侧边栏数据缓存时间（秒）
+    CONFIG_CACHE_TIMEOUT = 3600  # 站点配置快照的最长缓存时间（秒），配置修改后按版本号立即失效
+    PAGE_CACHE_TIMEOUT = 60  # 匿名访客整页缓存时间（秒），0表示关闭
+    ARTICLE_PAGINATION_MODE = 'page'  # 文章列表分页方式：page（页码）或 cursor（游标，深分页更快）；带页码的链接始终可用
     
     # 日志配置
     LOG_LEVEL = logging.INFO
@@ -172,6 +206,9 @@ class TestingConfig(Config):
     SESSION_COOKIE_SECURE = False
     COMMENT_AUTO_APPROVE = True
     STATS_ENABLE_VISITOR_LOG = False
+    VIEW_COUNT_FLUSH_INTERVAL = 0
+    IP_LOCATION_ONLINE_LOOKUP = False
+    GEO_RESOLVE_INTERVAL = 0
 
 
 # 配置字典
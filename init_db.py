@@ -11,12 +11,18 @@ python init_db.py --init        # 初始化数据库（创建表和初始数据
 python init_db.py --reset       # 重置数据库（删除所有数据并重新初始化）
 python init_db.py --upgrade     # 升级数据库结构（仅添加缺失的表和字段）
 python init_db.py --check       # 检查数据库状态
+python init_db.py --backfill-previews  # 为已有文章生成列表预览
+python init_db.py --reconcile-counters  # 按明细数据校正站点计数器（如总浏览量）
+python init_db.py --fold-likes  # 将点赞分片合并回文章点赞数（可配合cron定时执行）
+python init_db.py --build-rollups  # 根据访客日志重新生成访问统计汇总（可用 --days 限定最近天数）
+python init_db.py --rebuild-search-index  # 重建文章全文搜索索引
+python init_db.py --backfill-thread-paths  # 为已有评论生成线程物化路径
 """
 
 import os
 import sys
 import argparse
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -24,6 +30,12 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from app import create_app, db
 from app.models import Admin, Config, Article, Tag, Comment, SiteVisit, Music
 from app.utils import get_local_now
+from app.renderer import refresh_article_preview
+from app.counters import reconcile_counters
+from app.likes import fold_like_shards
+from app.visit_stats import build_visit_rollups
+from app.search import index_article, rebuild_search_index
+from app.cache import bump_versions, VERSION_CONFIG
 from sqlalchemy import text, inspect
 
 
@@ -60,7 +72,10 @@ def get_database_status():
     }
     
     # 检查表存在情况
-    tables = ['articles', 'tags', 'admins', 'site_config', 'comments', 'site_visits', 'article_tags', 'music']
+    tables = ['articles', 'tags', 'admins', 'site_config', 'comments', 'site_visits', 'article_tags', 'music',
+              'article_renders', 'cache_versions', 'site_counters',
+              'article_like_shards', 'visit_daily_stats', 'visit_hourly_stats', 'visit_daily_ips',
+              'visit_page_daily_stats', 'visit_referer_daily_stats', 'search_documents', 'search_postings']
     for table_name in tables:
         status['tables'][table_name] = check_table_exists(table_name)
     
@@ -158,6 +173,9 @@ def create_default_configs():
                 db.session.add(config)
                 created_count += 1
         
+        if created_count:
+            # 使各进程的配置快照失效
+            bump_versions(VERSION_CONFIG)
         db.session.commit()
         print(f"✅ 系统配置创建成功（新增 {created_count} 项）")
         return True
@@ -291,11 +309,13 @@ def create_welcome_article():
             article_data.pop('publish_location', None)
         
         article = Article(**article_data)
+        refresh_article_preview(article)
         
         if tech_tag:
             article.tags.append(tech_tag)
         
         db.session.add(article)
+        index_article(article)
         db.session.commit()
         
         print("✅ 欢迎文章创建成功")
@@ -307,6 +327,115 @@ def create_welcome_article():
         return False
 
 
+def backfill_article_previews(batch_size=100):
+    """为已有文章生成列表预览（分批提交）"""
+    print("🔄 生成文章列表预览...")
+    try:
+        updated_count = 0
+        last_id = 0
+        while True:
+            articles = Article.query.filter(Article.id > last_id)\
+                .order_by(Article.id).limit(batch_size).all()
+            if not articles:
+                break
+            
+            for article in articles:
+                refresh_article_preview(article)
+                updated_count += 1
+            
+            last_id = articles[-1].id
+            db.session.commit()
+        
+        print(f"✅ 文章列表预览生成完成（共 {updated_count} 篇）")
+        return True
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ 生成文章列表预览失败: {str(e)}")
+        return False
+
+
+def backfill_thread_paths():
+    """为已有评论生成线程物化路径"""
+    print("🔄 生成评论线程路径...")
+    try:
+        comment_count = Comment.rebuild_thread_paths()
+        print(f"✅ 评论线程路径生成完成（共 {comment_count} 条评论）")
+        return True
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ 生成评论线程路径失败: {str(e)}")
+        return False
+
+
+def reconcile_site_counters():
+    """按明细数据重新计算站点计数器"""
+    print("🔄 校正站点计数器...")
+    try:
+        for name, (old_value, new_value) in reconcile_counters().items():
+            if old_value is None:
+                print(f"   {name}: 新建，值为 {new_value}")
+            elif old_value != new_value:
+                print(f"   {name}: {old_value} -> {new_value}（已校正）")
+            else:
+                print(f"   {name}: {new_value}（无偏差）")
+        
+        print("✅ 站点计数器校正完成")
+        return True
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ 校正站点计数器失败: {str(e)}")
+        return False
+
+
+def fold_likes():
+    """将点赞分片合并回文章点赞数"""
+    print("🔄 合并点赞分片...")
+    try:
+        folded = fold_like_shards()
+        print(f"✅ 点赞分片合并完成（共 {folded} 次点赞）")
+        return True
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ 合并点赞分片失败: {str(e)}")
+        return False
+
+
+def build_rollups(days=None):
+    """根据访客日志重新生成访问统计汇总（days为空时处理全部日志）"""
+    print("🔄 生成访问统计汇总...")
+    try:
+        start_day = None
+        if days:
+            start_day = get_local_now().date() - timedelta(days=days - 1)
+        
+        day_count = build_visit_rollups(start_day)
+        print(f"✅ 访问统计汇总生成完成（共 {day_count} 天）")
+        return True
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ 生成访问统计汇总失败: {str(e)}")
+        return False
+
+
+def rebuild_search():
+    """重建文章全文搜索索引"""
+    print("🔄 重建全文搜索索引...")
+    try:
+        indexed_count = rebuild_search_index()
+        print(f"✅ 全文搜索索引重建完成（共 {indexed_count} 篇文章）")
+        return True
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ 重建全文搜索索引失败: {str(e)}")
+        return False
+
+
 def init_database():
     """初始化数据库"""
     print("=" * 60)
@@ -428,6 +557,58 @@ def upgrade_database():
                     "ALTER TABLE articles ADD COLUMN publish_location VARCHAR(100) DEFAULT '未知'"
                 ))
                 print("✅ publish_location 字段添加成功")
+            
+            # 添加列表预览字段
+            if 'preview' not in columns:
+                print("🔄 添加 preview 字段...")
+                db.session.execute(text(
+                    "ALTER TABLE articles ADD COLUMN preview TEXT"
+                ))
+                print("✅ preview 字段添加成功")
+            
+            if 'content_length' not in columns:
+                print("🔄 添加 content_length 字段...")
+                db.session.execute(text(
+                    "ALTER TABLE articles ADD COLUMN content_length INTEGER DEFAULT 0 NOT NULL"
+                ))
+                print("✅ content_length 字段添加成功")
+            
+            indexes = [index['name'] for index in inspector.get_indexes('articles')]
+            if 'ix_articles_status_top_updated_id' not in indexes:
+                print("🔄 添加 articles(status, is_top, updated_at, id) 索引...")
+                db.session.execute(text(
+                    "CREATE INDEX ix_articles_status_top_updated_id ON articles (status, is_top, updated_at, id)"
+                ))
+                print("✅ 文章列表排序索引添加成功")
+        
+        # 检查comments表的线程路径字段和索引
+        if 'comments' in inspector.get_table_names():
+            columns = [col['name'] for col in inspector.get_columns('comments')]
+            if 'thread_path' not in columns:
+                print("🔄 添加 comments.thread_path 字段...")
+                db.session.execute(text(
+                    "ALTER TABLE comments ADD COLUMN thread_path VARCHAR(255)"
+                ))
+                print("✅ comments.thread_path 字段添加成功")
+            
+            indexes = [index['name'] for index in inspector.get_indexes('comments')]
+            if 'ix_comments_article_thread_path' not in indexes:
+                print("🔄 添加 comments(article_id, thread_path) 索引...")
+                db.session.execute(text(
+                    "CREATE INDEX ix_comments_article_thread_path ON comments (article_id, thread_path)"
+                ))
+                print("✅ 评论线程路径索引添加成功")
+        
+        # 检查访问统计汇总表的独立访客概要字段
+        for table_name in ('visit_daily_stats', 'visit_page_daily_stats'):
+            if table_name in inspector.get_table_names():
+                columns = [col['name'] for col in inspector.get_columns(table_name)]
+                if 'ip_sketch' not in columns:
+                    print(f"🔄 添加 {table_name}.ip_sketch 字段...")
+                    db.session.execute(text(
+                        f"ALTER TABLE {table_name} ADD COLUMN ip_sketch BLOB"
+                    ))
+                    print(f"✅ {table_name}.ip_sketch 字段添加成功")
         
         # 检查music表的字段
         if 'music' in inspector.get_table_names():
@@ -443,6 +624,26 @@ def upgrade_database():
         
         db.session.commit()
         
+        # 生成文章列表预览（新增字段后需要回填）
+        if not backfill_article_previews():
+            return False
+        
+        # 生成评论线程路径（新增字段后需要回填）
+        if not backfill_thread_paths():
+            return False
+        
+        # 初始化站点计数器
+        if not reconcile_site_counters():
+            return False
+        
+        # 生成已有访客日志的统计汇总
+        if not build_rollups():
+            return False
+        
+        # 为已有文章建立全文搜索索引
+        if not rebuild_search():
+            return False
+        
         # 更新配置（添加新的配置项）
         print("🔄 更新系统配置...")
         if create_default_configs():
@@ -510,10 +711,19 @@ def main():
     parser.add_argument('--reset', action='store_true', help='重置数据库（删除所有数据并重新初始化）')
     parser.add_argument('--upgrade', action='store_true', help='升级数据库结构（仅添加缺失的表和字段）')
     parser.add_argument('--check', action='store_true', help='检查数据库状态')
+    parser.add_argument('--backfill-previews', action='store_true', help='为已有文章生成列表预览')
+    parser.add_argument('--reconcile-counters', action='store_true', help='按明细数据校正站点计数器（如总浏览量）')
+    parser.add_argument('--fold-likes', action='store_true', help='将点赞分片合并回文章点赞数')
+    parser.add_argument('--build-rollups', action='store_true', help='根据访客日志重新生成访问统计汇总')
+    parser.add_argument('--rebuild-search-index', action='store_true', help='重建文章全文搜索索引')
+    parser.add_argument('--backfill-thread-paths', action='store_true', help='为已有评论生成线程物化路径')
+    parser.add_argument('--days', type=int, help='配合 --build-rollups 使用，只处理最近N天')
     
     args = parser.parse_args()
     
-    if not any([args.init, args.reset, args.upgrade, args.check]):
+    if not any([args.init, args.reset, args.upgrade, args.check, args.backfill_previews,
+                args.reconcile_counters, args.fold_likes,
+                args.build_rollups, args.rebuild_search_index, args.backfill_thread_paths]):
         parser.print_help()
         return
     
@@ -542,6 +752,18 @@ def main():
                 success = reset_database()
             elif args.upgrade:
                 success = upgrade_database()
+            elif args.backfill_previews:
+                success = backfill_article_previews()
+            elif args.reconcile_counters:
+                success = reconcile_site_counters()
+            elif args.fold_likes:
+                success = fold_likes()
+            elif args.build_rollups:
+                success = build_rollups(args.days)
+            elif args.rebuild_search_index:
+                success = rebuild_search()
+            elif args.backfill_thread_paths:
+                success = backfill_thread_paths()
             
             if not success:
                 sys.exit(1)
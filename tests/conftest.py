@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.cache import local_cache, page_cache, versions
+
+
+@pytest.fixture
+def app():
+    """使用内存SQLite数据库的测试应用"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        # 进程内缓存在测试之间共享，每个测试从空缓存开始
+        local_cache.clear()
+        page_cache.clear()
+        versions.invalidate()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from app import db
+from app.models import Article, Comment
+
+
+def add_article():
+    article = Article(title='评论测试', content='正文', status='published')
+    db.session.add(article)
+    db.session.commit()
+    return article.id
+
+
+def add_comment(article_id, content, parent_id=None, status='approved'):
+    comment = Comment(content=content, ip_address='127.0.0.1', article_id=article_id,
+                      parent_id=parent_id, status=status)
+    db.session.add(comment)
+    db.session.commit()
+    return comment.id
+
+
+def fetch_comments(app, article_id, page=1):
+    response = app.test_client().get(f'/api/comments/{article_id}?page={page}')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['success']
+    return data
+
+
+def reply_tree(comment):
+    """评论及其各级回复的 (内容, [子树]) 结构"""
+    return comment['content'], [reply_tree(reply) for reply in comment['replies']]
+
+
+def test_thread_range_fetch_nests_replies(app):
+    article_id = add_article()
+    first = add_comment(article_id, 'first')
+    second = add_comment(article_id, 'second')
+    reply = add_comment(article_id, 'reply', first)
+    add_comment(article_id, 'nested', reply)
+    add_comment(article_id, 'reply to second', second)
+    add_comment(article_id, 'pending', first, status='pending')
+    add_comment(article_id, 'second reply', first)
+
+    data = fetch_comments(app, article_id)
+
+    assert [reply_tree(comment) for comment in data['comments']] == [
+        ('second', [('reply to second', [])]),
+        ('first', [('reply', [('nested', [])]), ('second reply', [])]),
+    ]
+    assert data['stats'] == {'total_comments': 6, 'root_comments': 2, 'replies': 4}
+
+
+def test_thread_range_skips_threads_on_other_pages(app):
+    article_id = add_article()
+    root_ids = [add_comment(article_id, f'root {i}') for i in range(12)]
+    for root_id in root_ids:
+        add_comment(article_id, f'reply to {root_id}', root_id)
+
+    first_page = fetch_comments(app, article_id, page=1)['comments']
+    second_page = fetch_comments(app, article_id, page=2)['comments']
+
+    assert [comment['id'] for comment in first_page] == root_ids[::-1][:10]
+    assert [comment['id'] for comment in second_page] == root_ids[::-1][10:]
+    for comment in first_page + second_page:
+        assert [reply['content'] for reply in comment['replies']] == [f"reply to {comment['id']}"]
+
+
+def test_too_deep_reply_is_kept_under_its_parent(app):
+    article_id = add_article()
+    root_id = add_comment(article_id, 'level 0')
+    parent_id = root_id
+    for level in range(1, 30):
+        parent_id = add_comment(article_id, f'level {level}', parent_id)
+
+    # 超过最大长度的回复在路径上作为父评论的同级，仍在线程范围内
+    deepest = db.session.get(Comment, parent_id)
+    assert len(deepest.thread_path) <= Comment.THREAD_PATH_MAX_LENGTH
+    assert deepest.thread_path.startswith(db.session.get(Comment, root_id).thread_path)
+
+    comment = fetch_comments(app, article_id)['comments'][0]
+    levels = []
+    while comment is not None:
+        levels.append(comment['content'])
+        comment = comment['replies'][0] if comment['replies'] else None
+    assert levels == [f'level {level}' for level in range(30)]
+
+
+def test_replies_without_thread_path_are_not_lost(app):
+    article_id = add_article()
+    root_id = add_comment(article_id, 'old root')
+    reply_id = add_comment(article_id, 'old reply', root_id)
+    add_comment(article_id, 'old nested', reply_id)
+    other_root = add_comment(article_id, 'new root')
+    add_comment(article_id, 'new reply', other_root)
+
+    # 模拟未执行回填的旧数据
+    Comment.query.filter(Comment.id.in_([root_id, reply_id])).update(
+        {Comment.thread_path: None}, synchronize_session=False
+    )
+    db.session.commit()
+    # 父评论没有路径时，新回复的路径同样留空
+    late_reply = add_comment(article_id, 'late reply', root_id)
+    assert db.session.get(Comment, late_reply).thread_path is None
+
+    data = fetch_comments(app, article_id)
+
+    assert [reply_tree(comment) for comment in data['comments']] == [
+        ('new root', [('new reply', [])]),
+        ('old root', [('old reply', [('old nested', [])]), ('late reply', [])]),
+    ]
+
+    Comment.rebuild_thread_paths()
+    assert Comment.query.filter(Comment.thread_path.is_(None)).count() == 0
+    assert [reply_tree(comment) for comment in fetch_comments(app, article_id)['comments']] == [
+        ('new root', [('new reply', [])]),
+        ('old root', [('old reply', [('old nested', [])]), ('late reply', [])]),
+    ]
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+import app.geo as geo
+from app import db
+from app.geo import GeoLocator
+from app.models import Article, Comment
+
+
+@pytest.fixture
+def locator(app, monkeypatch):
+    app.config.update(IP_LOCATION_ONLINE_LOOKUP=True, GEO_BREAKER_THRESHOLD=1, GEO_BREAKER_COOLDOWN=0,
+                      GEO_RETRY_DELAY=0, GEO_RETRY_LIMIT=2)
+    monkeypatch.setattr(geo, 'lookup_local_ip_location', lambda ip_address: None)
+    locator = GeoLocator()
+    locator.init_app(app)
+    return locator
+
+
+def add_comment(ip_address):
+    article = Article(title='归属地', content='正文', status='published')
+    db.session.add(article)
+    db.session.flush()
+    comment = Comment(content='评论', ip_address=ip_address, article_id=article.id, status='approved')
+    db.session.add(comment)
+    db.session.commit()
+    return comment
+
+
+def test_failed_lookup_is_retried(locator, monkeypatch):
+    provider_up = False
+
+    def fetch(ip_address, timeout=3):
+        if not provider_up:
+            raise IOError('provider down')
+        return '测试省'
+
+    monkeypatch.setattr(geo, 'fetch_ip_location', fetch)
+    comment = add_comment('6.6.6.6')
+
+    locator.resolve_later(comment.id, comment.article_id, comment.ip_address)
+    assert db.session.get(Comment, comment.id).location is None
+    assert locator.get_stats()['retrying'] == 1
+
+    provider_up = True
+    assert locator.flush() == 1
+    db.session.expire_all()
+    assert db.session.get(Comment, comment.id).location == '测试省'
+    assert locator.get_stats()['retrying'] == 0
+
+
+def test_retries_stop_after_limit(locator, monkeypatch):
+    def fetch(ip_address, timeout=3):
+        raise IOError('provider down')
+
+    monkeypatch.setattr(geo, 'fetch_ip_location', fetch)
+    comment = add_comment('7.7.7.7')
+
+    locator.resolve_later(comment.id, comment.article_id, comment.ip_address)
+    locator.flush()
+    locator.flush()
+
+    stats = locator.get_stats()
+    assert stats['retrying'] == 0
+    assert stats['abandoned'] == 1
+    assert db.session.get(Comment, comment.id).location is None
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from app.ipdb import parse_csv_ranges, build_database, IPDatabase
+
+
+def write_csv(tmp_path, text):
+    path = tmp_path / 'ranges.csv'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_columns_default_after_ip_columns(tmp_path):
+    path = write_csv(tmp_path, 'start,end,country,region\n1.0.0.0,1.0.0.255,CN,广东\n2.0.0.0/24,US,California\n')
+
+    locations = [location for _, _, location in parse_csv_ranges(path)]
+
+    assert locations == ['广东省', 'US']
+
+
+def test_region_defaults_to_column_after_country(tmp_path):
+    # 国家列不紧跟IP列时，省份列默认取国家列的下一列
+    path = write_csv(tmp_path, '1.0.0.0,1.0.0.255,亚洲,中国,浙江,杭州\n')
+
+    assert [location for _, _, location in parse_csv_ranges(path, country_column=3)] == ['浙江省']
+    assert [location for _, _, location in parse_csv_ranges(path, country_column=3, region_column=5)] == ['杭州省']
+
+
+def test_build_and_lookup(tmp_path):
+    path = write_csv(tmp_path, '1.0.0.0,1.0.0.255,CN,北京市\n16777472,16777727,JP,Tokyo\n2001:db8::,2001:db8::ffff,DE,\n')
+    database_path = str(tmp_path / 'ip.db')
+
+    assert build_database(parse_csv_ranges(path), database_path) == {4: 2, 6: 1}
+
+    database = IPDatabase(database_path)
+    try:
+        assert database.lookup('1.0.0.8') == '北京市'
+        assert database.lookup('1.0.1.8') == 'JP'
+        assert database.lookup('::ffff:1.0.0.1') == '北京市'
+        assert database.lookup('2001:db8::1') == 'DE'
+        assert database.lookup('8.8.8.8') is None
+        assert database.lookup('not an ip') is None
+    finally:
+        database.close()
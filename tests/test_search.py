@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from app import db
+from app.models import Article
+from app.search import index_article, rank_articles
+
+
+def add_article(title, content='', summary=None):
+    article = Article(title=title, content=content, summary=summary, status='published')
+    db.session.add(article)
+    index_article(article)
+    db.session.commit()
+    return article.id
+
+
+def test_partial_word_matches_by_prefix(app):
+    python_id = add_article('Python 入门', '介绍 Python 的基础语法')
+    add_article('Java 入门', '介绍 Java 的基础语法')
+
+    assert rank_articles('pyth') == [python_id]
+    assert rank_articles('py') == [python_id]
+
+
+def test_whole_word_ranks_above_prefix_match(app):
+    prefix_id = add_article('Pythonic 代码', 'pythonic pythonic')
+    exact_id = add_article('Python 代码', 'python python')
+
+    assert rank_articles('python') == [exact_id, prefix_id]
+
+
+def test_mixed_case_query(app):
+    article_id = add_article('Flask Web 开发', 'flask 路由与模板')
+
+    assert rank_articles('FLASK') == [article_id]
+    assert rank_articles('FlAsK web') == [article_id]
+    assert rank_articles('Fla') == [article_id]
+
+
+def test_cjk_text(app):
+    search_id = add_article('全文搜索的实现', '倒排索引与 BM25 相关度排序')
+    other_id = add_article('缓存设计', '进程内缓存')
+
+    assert rank_articles('搜索') == [search_id]
+    assert rank_articles('索引') == [search_id]
+    assert rank_articles('缓') == [other_id]
+    # 中英文混合查询
+    assert rank_articles('全文 bm2') == [search_id]
+
+
+def test_no_match(app):
+    add_article('Python 入门', '基础语法')
+
+    assert rank_articles('golang') == []
+    assert rank_articles('') == []
+
+
+def test_verify_article_body_is_not_indexed(app):
+    locked = Article(title='私密日记', content='secretword 只有验证后才能看到', summary='日记摘要',
+                     status='published', permission='verify')
+    db.session.add(locked)
+    index_article(locked)
+    db.session.commit()
+    public_id = add_article('公开文章', 'secretword 出现在公开正文中')
+
+    assert rank_articles('secretword') == [public_id]
+    # 标题和摘要仍可搜索
+    assert rank_articles('私密') == [locked.id]
+    assert rank_articles('日记摘要') == [locked.id]
+
+    client = app.test_client()
+    page = client.get('/search?q=secretword').get_data(as_text=True)
+    # 搜索结果卡片中只有公开文章（侧边栏时间线仍会列出全部文章）
+    assert f'article-card" id="article-{public_id}"' in page
+    assert f'article-card" id="article-{locked.id}"' not in page
+    assert client.get(f'/api/article-page/{locked.id}?q=secretword').get_json()['success'] is False
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from app.suggest import _PrefixPart, _build_entries, MAX_KEY_LENGTH
+
+
+def make_part(items):
+    part = _PrefixPart('articles', lambda: list(items))
+    part.refresh(1)
+    return part
+
+
+def matched_ids(part, prefix):
+    return sorted({entry[3] for entry in part.lookup(prefix, 8)})
+
+
+def test_incremental_refresh_matches_full_build():
+    items = [('article', i, f'Python 笔记 {i}') for i in range(40)]
+    part = make_part(items)
+
+    items[3] = ('article', 3, 'Flask 入门')
+    del items[10]
+    items.append(('article', 99, '缓存设计'))
+    part.refresh(2)
+
+    assert part.entries == _build_entries(items)
+    assert part.keys == [entry[0] for entry in part.entries]
+    assert matched_ids(part, 'flask') == [3]
+    assert matched_ids(part, '缓存') == [99]
+    assert 10 not in {entry[3] for entry in part.entries}
+
+
+def test_unchanged_version_does_not_reload():
+    calls = []
+    part = _PrefixPart('articles', lambda: calls.append(1) or [('article', 1, 'Python')])
+    part.refresh(1)
+    part.refresh(1)
+
+    assert len(calls) == 1
+
+
+def test_long_titles_store_bounded_keys():
+    title = '长' * 200
+    part = make_part([('article', 1, title), ('article', 2, '长' * 40 + '短')])
+
+    assert max(len(key) for key in part.keys) == MAX_KEY_LENGTH
+    # 超过键长度的输入按名称补充检查
+    assert matched_ids(part, '长' * 40 + '短') == [2]
+    assert matched_ids(part, '长' * 50) == [1]
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, time, timedelta
+from app import db
+from app.hll import HyperLogLog
+from app.models import SiteVisit, VisitDailyStat, VisitPageDailyStat
+from app.utils import get_local_now
+from app.visit_stats import rollup_day, get_visit_summary, get_popular_pages
+
+
+def add_visits(day, ips, page_url='/'):
+    for ip_address in ips:
+        db.session.add(SiteVisit(ip_address=ip_address, session_id=ip_address, page_url=page_url,
+                                 visit_time=datetime.combine(day, time(12))))
+
+
+def rollup(*days):
+    for day in days:
+        rollup_day(day)
+    db.session.commit()
+
+
+def merged_count(model, **filters):
+    return HyperLogLog.merge_all(row.ip_sketch for row in model.query.filter_by(**filters)).count()
+
+
+def test_all_time_unique_matches_full_merge(app):
+    today = get_local_now().date()
+    days = [today - timedelta(days=offset) for offset in range(10, -1, -1)]
+    for index, day in enumerate(days):
+        add_visits(day, [f'10.0.{index}.{n}' for n in range(20)] + ['10.9.9.9'])
+    rollup(*days)
+
+    assert get_visit_summary(None, None)['unique'] == merged_count(VisitDailyStat)
+
+    # 重新汇总较早的日期后缓存失效
+    add_visits(days[0], [f'10.1.0.{n}' for n in range(30)])
+    rollup(days[0])
+    assert get_visit_summary(None, None)['unique'] == merged_count(VisitDailyStat)
+
+
+def test_recent_days_are_not_cached(app):
+    today = get_local_now().date()
+    week_ago = today - timedelta(days=6)
+    add_visits(week_ago, [f'10.0.0.{n}' for n in range(20)], '/a')
+    rollup(week_ago)
+    assert get_visit_summary(week_ago, today)['unique'] == merged_count(VisitDailyStat)
+    assert get_popular_pages(week_ago, today)[0].unique_visitors == merged_count(VisitPageDailyStat, page_url='/a')
+
+    # 今天的汇总不会递增版本，新的访客仍然计入
+    add_visits(today, [f'10.0.1.{n}' for n in range(15)], '/a')
+    rollup(today)
+    assert get_visit_summary(week_ago, today)['unique'] == merged_count(VisitDailyStat)
+    assert get_popular_pages(week_ago, today)[0].unique_visitors == merged_count(VisitPageDailyStat, page_url='/a')